@@ -1,5 +1,5 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 
 from mcp_sandbox.auth.auth import authenticate_user, get_current_active_user
@@ -107,7 +107,7 @@ async def get_user_sandboxes(current_user: User = Depends(get_current_active_use
     return {"sandboxes": sandboxes}
 
 @router.delete("/users/me/sandboxes/{sandbox_id}")
-async def delete_user_sandbox(sandbox_id: str, current_user: User = Depends(get_current_active_user)):
+async def delete_user_sandbox(sandbox_id: str, request: Request, current_user: User = Depends(get_current_active_user)):
     """Delete a sandbox by ID (both database record and Docker container)"""
     # First, check if the sandbox exists and belongs to the current user
     if not db.is_sandbox_owner(current_user.id, sandbox_id):
@@ -124,10 +124,15 @@ async def delete_user_sandbox(sandbox_id: str, current_user: User = Depends(get_
             detail="Sandbox not found in database"
         )
     
-    # Create a new instance of SandboxManager to handle Docker containers
-    from mcp_sandbox.core.sandbox_modules.manager import SandboxManager
+    # Delete through the running MCP environment, so its shell channels and cached
+    # handles for the container are dropped too; fall back to a fresh SandboxManager
     from mcp_sandbox.utils.config import logger
-    sandbox_manager = SandboxManager()
+    sandbox_plugin = getattr(request.app.state, "sandbox_plugin", None)
+    if sandbox_plugin is not None:
+        sandbox_manager = sandbox_plugin.sandbox_env
+    else:
+        from mcp_sandbox.core.sandbox_modules.manager import SandboxManager
+        sandbox_manager = SandboxManager()
     
     # Get the Docker container ID from the record
     docker_container_id = sandbox_record.get("docker_container_id")
@@ -140,6 +145,7 @@ async def delete_user_sandbox(sandbox_id: str, current_user: User = Depends(get_
             logger.error(f"Failed to delete Docker container: {result.get('message', 'Unknown error')}")
     else:
         logger.warning(f"No Docker container ID found for sandbox: {sandbox_id}")
+    sandbox_manager.drop_sandbox_caches(sandbox_id)
     
     # Delete the sandbox from the database
     if not db.delete_sandbox(sandbox_id):
@@ -148,4 +154,8 @@ async def delete_user_sandbox(sandbox_id: str, current_user: User = Depends(get_
             detail="Failed to delete sandbox from database"
         )
     
+    # Forget cached MCP access checks for the deleted sandbox
+    if sandbox_plugin is not None:
+        sandbox_plugin.invalidate_sandbox_access(sandbox_id)
+    
     return {"message": "Sandbox deleted successfully"}
@@ -11,6 +11,9 @@ def configure_app(app: FastAPI, sandbox_plugin):
     # Mount sandbox file access routes
     app.include_router(sandbox_file_router)
 
+    # Let other routes (e.g. sandbox deletion) reach the plugin's caches
+    app.state.sandbox_plugin = sandbox_plugin
+
     # Get the MCP server from the plugin
     mcp_server = sandbox_plugin.mcp._mcp_server
     
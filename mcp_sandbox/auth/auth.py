@@ -1,3 +1,4 @@
+import asyncio
 from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
@@ -24,7 +25,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     except JWTError:
         raise credentials_exception
     
-    user = db.get_user(username=token_data.username)
+    user = await asyncio.to_thread(db.get_user, username=token_data.username)
     if user is None:
         raise credentials_exception
     
@@ -1,11 +1,59 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Final, Optional, Tuple
+import asyncio
+import threading
+import time
+from collections import OrderedDict
 from fastmcp import FastMCP
 from mcp_sandbox.core.sandbox_modules.manager import SandboxManager
 from mcp_sandbox.core.sandbox_modules.file_ops import SandboxFileOpsMixin
 from mcp_sandbox.core.sandbox_modules.package import SandboxPackageMixin
 from mcp_sandbox.core.sandbox_modules.records import SandboxRecordsMixin
 from mcp_sandbox.core.sandbox_modules.execution import SandboxExecutionMixin
-from mcp_sandbox.utils.config import DEFAULT_DOCKER_IMAGE
+from mcp_sandbox.utils.config import (
+    DEFAULT_DOCKER_IMAGE, WARM_POOL_SIZE, WARM_POOL_TTL, REQUIRE_AUTH, DEFAULT_USER_ID
+)
+from mcp_sandbox.db.database import db
+
+# Sandbox ownership rarely changes, so access checks are cached briefly
+ACCESS_CACHE_TTL = 60
+ACCESS_CACHE_SIZE = 4096
+ACCESS_DENIED_MESSAGE = "Access denied. You don't have permission to access this sandbox."
+
+# MCP tool specs, passed to FastMCP.tool()
+_LIST_SANDBOXES_TOOL: Final[Dict[str, str]] = {
+    "name": "list_sandboxes",
+    "description": "Lists all existing Python sandboxes and their status. Each item also includes installed Python packages.",
+}
+
+_CREATE_SANDBOX_TOOL: Final[Dict[str, str]] = {
+    "name": "create_sandbox",
+    "description": "Creates a new Python sandbox and returns its ID for subsequent operations. Optional parameter: name (string) - Custom name for the sandbox",
+}
+
+_INSTALL_PACKAGE_IN_SANDBOX_TOOL: Final[Dict[str, str]] = {
+    "name": "install_package_in_sandbox",
+    "description": "Installs a Python package in the specified sandbox. Parameters: sandbox_id (string), package_name (string)",
+}
+
+_CHECK_PACKAGE_INSTALLATION_STATUS_TOOL: Final[Dict[str, str]] = {
+    "name": "check_package_installation_status",
+    "description": "Checks the installation status of a package in a sandbox. Parameters: sandbox_id (string), package_name (string)",
+}
+
+_EXECUTE_PYTHON_CODE_TOOL: Final[Dict[str, str]] = {
+    "name": "execute_python_code",
+    "description": "Executes Python code in a sandbox and returns results with links to generated files. Parameters: sandbox_id (string) - The sandbox ID to use, code (string) - The Python code to execute",
+}
+
+_EXECUTE_TERMINAL_COMMAND_TOOL: Final[Dict[str, str]] = {
+    "name": "execute_terminal_command",
+    "description": "Executes a terminal command in the specified sandbox. Parameters: sandbox_id (string), command (string). Returns stdout, stderr, exit_code.",
+}
+
+_UPLOAD_FILE_TO_SANDBOX_TOOL: Final[Dict[str, str]] = {
+    "name": "upload_file_to_sandbox",
+    "description": "Uploads a local file to the specified sandbox. Parameters: sandbox_id (string), local_file_path (string), dest_path (string, optional, default: /app/results).",
+}
 
 class SandboxEnvironment(
     SandboxManager, SandboxFileOpsMixin, SandboxPackageMixin, SandboxRecordsMixin, SandboxExecutionMixin
@@ -17,8 +65,12 @@ class SandboxToolsPlugin:
     
     def __init__(self, base_image: str = DEFAULT_DOCKER_IMAGE):
         self.sandbox_env = SandboxEnvironment(base_image=base_image)
+        self.sandbox_env.enable_warm_pool(WARM_POOL_SIZE, WARM_POOL_TTL)
         self.mcp = FastMCP("Python Sandbox Executor")
         self.user_context = {}
+        # (user_id, sandbox_id) -> (is_owner, expiry as time.monotonic())
+        self._access_cache: OrderedDict[Tuple[str, str], Tuple[bool, float]] = OrderedDict()
+        self._access_lock = threading.Lock()
         self._register_tools()
     
     def set_user_context(self, user_id: str):
@@ -29,8 +81,6 @@ class SandboxToolsPlugin:
         """Get the current user ID from context
         
         When authentication is disabled, returns the default user ID from config"""
-        from mcp_sandbox.utils.config import REQUIRE_AUTH, DEFAULT_USER_ID
-        
         # If authentication is disabled, return default user ID
         if not REQUIRE_AUTH:
             return DEFAULT_USER_ID
@@ -38,97 +88,120 @@ class SandboxToolsPlugin:
         # Otherwise return from user context
         return self.user_context.get("user_id")
     
-    def validate_sandbox_access(self, sandbox_id: str) -> bool:
+    async def validate_sandbox_access(self, sandbox_id: str) -> bool:
         """Validate if the current user has access to the sandbox"""
-        from mcp_sandbox.db.database import db
-        
         user_id = self.get_current_user_id()
         if not user_id:
             return False
         
-        return db.is_sandbox_owner(user_id, sandbox_id)
+        key = (user_id, sandbox_id)
+        now = time.monotonic()
+        with self._access_lock:
+            cached = self._access_cache.get(key)
+            if cached and cached[1] > now:
+                self._access_cache.move_to_end(key)
+                return cached[0]
+        
+        # Cache misses query the database in a worker thread, like the tool calls themselves
+        is_owner = await asyncio.to_thread(db.is_sandbox_owner, user_id, sandbox_id)
+        self._cache_access(user_id, sandbox_id, is_owner)
+        return is_owner
+    
+    @staticmethod
+    def _access_denied(command_result: bool = False) -> Dict[str, Any]:
+        """Build the response returned when the user doesn't own the sandbox
+        
+        Args:
+            command_result: Shape it like a terminal command result (stdout/stderr/exit_code)
+        """
+        if command_result:
+            return {"stdout": "", "stderr": ACCESS_DENIED_MESSAGE, "exit_code": -1}
+        return {"error": ACCESS_DENIED_MESSAGE}
+    
+    def _cache_access(self, user_id: str, sandbox_id: str, is_owner: bool) -> None:
+        """Remember an ownership check result for ACCESS_CACHE_TTL seconds"""
+        key = (user_id, sandbox_id)
+        with self._access_lock:
+            self._access_cache[key] = (is_owner, time.monotonic() + ACCESS_CACHE_TTL)
+            self._access_cache.move_to_end(key)
+            while len(self._access_cache) > ACCESS_CACHE_SIZE:
+                self._access_cache.popitem(last=False)
+    
+    def invalidate_sandbox_access(self, sandbox_id: str) -> None:
+        """Drop cached access results for a sandbox, e.g. after it is deleted"""
+        with self._access_lock:
+            for key in [key for key in self._access_cache if key[1] == sandbox_id]:
+                del self._access_cache[key]
+    
+    # (tool spec, handler method)
+    _TOOLS = [
+        (_LIST_SANDBOXES_TOOL, "_tool_list_sandboxes"),
+        (_CREATE_SANDBOX_TOOL, "_tool_create_sandbox"),
+        (_INSTALL_PACKAGE_IN_SANDBOX_TOOL, "_tool_install_package_in_sandbox"),
+        (_CHECK_PACKAGE_INSTALLATION_STATUS_TOOL, "_tool_check_package_installation_status"),
+        (_EXECUTE_PYTHON_CODE_TOOL, "_tool_execute_python_code"),
+        (_EXECUTE_TERMINAL_COMMAND_TOOL, "_tool_execute_terminal_command"),
+        (_UPLOAD_FILE_TO_SANDBOX_TOOL, "_tool_upload_file_to_sandbox"),
+    ]
     
     def _register_tools(self):
-        """Register all MCP tools"""
-
-        @self.mcp.tool(
-            name="list_sandboxes",
-            description="Lists all existing Python sandboxes and their status. Each item also includes installed Python packages."
-        )
-        def list_sandboxes() -> list:
-            # Get user ID
-            user_id = self.get_current_user_id()
-            
-            # Call list_user_sandboxes method in sandbox_modules
-            return self.sandbox_env.list_user_sandboxes(user_id)
-
-        @self.mcp.tool(
-            name="create_sandbox", 
-            description="Creates a new Python sandbox and returns its ID for subsequent operations. Optional parameter: name (string) - Custom name for the sandbox"
-        )
-        def create_sandbox(name: Optional[str] = None) -> dict:
-            # Get user ID
-            user_id = self.get_current_user_id()
-            
-            # Call create_user_sandbox method in sandbox_modules
-            return self.sandbox_env.create_user_sandbox(user_id, name)
-
-        @self.mcp.tool(
-            name="install_package_in_sandbox",
-            description="Installs a Python package in the specified sandbox. Parameters: sandbox_id (string), package_name (string)"
-        )
-        def install_package_in_sandbox(sandbox_id: str, package_name: str) -> Dict[str, Any]:
-            # Validate sandbox access
-            if not self.validate_sandbox_access(sandbox_id):
-                return {"error": "Access denied. You don't have permission to access this sandbox."}
-            
-            return self.sandbox_env.install_package(sandbox_id, package_name)
-
-        @self.mcp.tool(
-            name="check_package_installation_status",
-            description="Checks the installation status of a package in a sandbox. Parameters: sandbox_id (string), package_name (string)"
-        )
-        def check_package_installation_status(sandbox_id: str, package_name: str) -> Dict[str, Any]:
-            # Validate sandbox access
-            if not self.validate_sandbox_access(sandbox_id):
-                return {"error": "Access denied. You don't have permission to access this sandbox."}
-            
-            return self.sandbox_env.check_package_status(sandbox_id, package_name)
-
-        @self.mcp.tool(
-            name="execute_python_code", 
-            description="Executes Python code in a sandbox and returns results with links to generated files. Parameters: sandbox_id (string) - The sandbox ID to use, code (string) - The Python code to execute"
-        )
-        def execute_python_code(sandbox_id: str, code: str) -> Dict[str, Any]:
-            # Validate sandbox access
-            if not self.validate_sandbox_access(sandbox_id):
-                return {"error": "Access denied. You don't have permission to access this sandbox."}
-            
-            return self.sandbox_env.execute_python_code(sandbox_id, code)
-
-        @self.mcp.tool(
-            name="execute_terminal_command",
-            description="Executes a terminal command in the specified sandbox. Parameters: sandbox_id (string), command (string). Returns stdout, stderr, exit_code."
-        )
-        def execute_terminal_command(sandbox_id: str, command: str) -> Dict[str, Any]:
-            # Verify sandbox access permissions
-            if not self.validate_sandbox_access(sandbox_id):
-                return {
-                    "stdout": "",
-                    "stderr": "Access denied. You don't have permission to access this sandbox.",
-                    "exit_code": -1
-                }
-            
-            # Call execute_terminal_command method in sandbox_modules
-            return self.sandbox_env.execute_terminal_command(sandbox_id, command)
-
-        @self.mcp.tool(
-            name="upload_file_to_sandbox",
-            description="Uploads a local file to the specified sandbox. Parameters: sandbox_id (string), local_file_path (string), dest_path (string, optional, default: /app/results)."
-        )
-        def upload_file_to_sandbox(sandbox_id: str, local_file_path: str, dest_path: str = "/app/results") -> dict:
-            # Validate sandbox access
-            if not self.validate_sandbox_access(sandbox_id):
-                return {"error": "Access denied. You don't have permission to access this sandbox."}
-            
-            return self.sandbox_env.upload_file_to_sandbox(sandbox_id, local_file_path, dest_path)
+        """Register all MCP tools
+        
+        Handlers are async and run the blocking Docker work in a worker thread,
+        so one slow sandbox call doesn't stall the event loop for other requests.
+        """
+        for tool_spec, method_name in self._TOOLS:
+            self.mcp.tool(**tool_spec)(getattr(self, method_name))
+
+    async def _tool_list_sandboxes(self) -> list:
+        # Get user ID
+        user_id = self.get_current_user_id()
+        
+        # Call list_user_sandboxes method in sandbox_modules
+        return await asyncio.to_thread(self.sandbox_env.list_user_sandboxes, user_id)
+
+    async def _tool_create_sandbox(self, name: Optional[str] = None) -> dict:
+        # Get user ID
+        user_id = self.get_current_user_id()
+        
+        # Call create_user_sandbox method in sandbox_modules
+        result = await asyncio.to_thread(self.sandbox_env.create_user_sandbox, user_id, name)
+        if result.get("sandbox_id"):
+            self._cache_access(user_id, result["sandbox_id"], True)
+        return result
+
+    async def _tool_install_package_in_sandbox(self, sandbox_id: str, package_name: str) -> Dict[str, Any]:
+        # Validate sandbox access
+        if not await self.validate_sandbox_access(sandbox_id):
+            return self._access_denied()
+        
+        return await asyncio.to_thread(self.sandbox_env.install_package, sandbox_id, package_name)
+
+    async def _tool_check_package_installation_status(self, sandbox_id: str, package_name: str) -> Dict[str, Any]:
+        # Validate sandbox access
+        if not await self.validate_sandbox_access(sandbox_id):
+            return self._access_denied()
+        
+        return await asyncio.to_thread(self.sandbox_env.check_package_status, sandbox_id, package_name)
+
+    async def _tool_execute_python_code(self, sandbox_id: str, code: str) -> Dict[str, Any]:
+        # Validate sandbox access
+        if not await self.validate_sandbox_access(sandbox_id):
+            return self._access_denied()
+        
+        return await asyncio.to_thread(self.sandbox_env.execute_python_code, sandbox_id, code)
+
+    async def _tool_execute_terminal_command(self, sandbox_id: str, command: str) -> Dict[str, Any]:
+        # Verify sandbox access permissions
+        if not await self.validate_sandbox_access(sandbox_id):
+            return self._access_denied(command_result=True)
+        
+        # Call execute_terminal_command method in sandbox_modules
+        return await asyncio.to_thread(self.sandbox_env.execute_terminal_command, sandbox_id, command)
+
+    async def _tool_upload_file_to_sandbox(self, sandbox_id: str, local_file_path: str, dest_path: str = "/app/results") -> dict:
+        # Validate sandbox access
+        if not await self.validate_sandbox_access(sandbox_id):
+            return self._access_denied()
+        
+        return await asyncio.to_thread(self.sandbox_env.upload_file_to_sandbox, sandbox_id, local_file_path, dest_path)
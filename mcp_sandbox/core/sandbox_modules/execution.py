@@ -1,5 +1,23 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple, Union
+import codecs
+import logging
+import socket
+import threading
 import time
+from docker.errors import APIError
+from docker.utils.socket import STDOUT, frames_iter
+from mcp_sandbox.core.sandbox_modules.shell import (
+    DETACHED_COMMAND_WRAPPER, ShellChannel, ShellChannelBusy, ShellChannelClosed, timeout_note
+)
+from mcp_sandbox.utils.config import logger, COMMAND_TIMEOUT, MAX_OUTPUT_BYTES
+
+# Appended to stdout when output is cut off at MAX_OUTPUT_BYTES
+TRUNCATION_MARKER = f"\n[output truncated after {MAX_OUTPUT_BYTES} bytes]"
+# Code and output dumps in debug logs are cut off after this many characters
+MAX_LOGGED_CHARS = 4096
+_SEP = "=" * 50
+# Seconds subtracted from the run's start time when looking for files it created
+CTIME_SLACK = 0.01
 
 class SandboxExecutionMixin:
     def execute_python_code(self, sandbox_id: str, code: str) -> Dict[str, Any]:
@@ -7,56 +25,31 @@ class SandboxExecutionMixin:
         error = self.verify_sandbox_exists(sandbox_id)
         if error:
             return error
-        start_ts = int(time.time())
-        logger = self._get_logger()
-        logger.info("Executing code:")
-        logger.info("=" * 50)
-        logger.info(code)
-        logger.info("=" * 50)
+        # File ctimes come from the kernel's coarse clock, which can lag the wall clock by a tick
+        start_ts = time.time_ns() / 1e9 - CTIME_SLACK
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            logger.debug("Executing code:\n%s\n%s\n%s", _SEP, code[:MAX_LOGGED_CHARS], _SEP)
         logger.info(f"Running code in sandbox {sandbox_id}")
         try:
             with self._get_running_sandbox(sandbox_id) as sandbox:
-                temp_code_file = "/tmp/code_to_run.py"
-                write_code_cmd = f"cat > {temp_code_file} << 'EOL'\n{code}\nEOL"
-                write_result = sandbox.exec_run(
-                    cmd=["sh", "-c", write_code_cmd],
-                    workdir="/app/results",
-                    privileged=False
-                )
-                if write_result.exit_code != 0:
-                    logger.error(f"Failed to write code to sandbox: {write_result.output.decode('utf-8')}")
-                    return {
-                        "error": "Failed to prepare code execution",
-                        "stdout": "",
-                        "stderr": write_result.output.decode('utf-8'),
-                        "exit_code": write_result.exit_code,
-                        "files": [],
-                        "file_links": []
-                    }
-                exec_result = sandbox.exec_run(
-                    cmd=["python", temp_code_file],
-                    workdir="/app/results",
-                    stdout=True,
-                    stderr=True,
-                    demux=True,
-                    privileged=False
-                )
-                exit_code = exec_result.exit_code
-                stdout_bytes, stderr_bytes = exec_result.output
-                stdout = stdout_bytes.decode('utf-8') if stdout_bytes else ""
-                stderr = stderr_bytes.decode('utf-8') if stderr_bytes else ""
-                sandbox.exec_run(cmd=["rm", "-f", temp_code_file], privileged=False)
-                all_files = self.list_files_in_sandbox(sandbox_id, with_stat=True)
-                new_files = [f for f, ctime in all_files if ctime >= start_ts]
-                file_links = [self.get_file_link(sandbox_id, f) for f in new_files]
-                logger.info("Execution results:")
-                logger.info(f"Exit code: {exit_code}")
-                if stdout:
-                    logger.info("Stdout:")
-                    logger.info(stdout)
-                if stderr:
-                    logger.warning("Stderr:")
-                    logger.warning(stderr)
+                # Feed the code to `python -` over the exec's stdin: one exec, no temp file
+                exit_code, stdout, stderr = self._retry_if_stale(sandbox_id, sandbox, lambda: self._exec_streamed(
+                    sandbox, ["python", "-"], workdir="/app/results", stdin_data=code.encode("utf-8")
+                ))
+                # A run that failed without printing anything almost never leaves files behind
+                if exit_code == 0 or stdout:
+                    new_files = self._list_new_files(sandbox, start_ts)
+                    file_links = self.get_file_links(sandbox_id, new_files)
+                else:
+                    new_files = []
+                    file_links = []
+                logger.info(f"Execution in sandbox {sandbox_id} finished with exit code {exit_code}")
+                if debug_enabled:
+                    if stdout:
+                        logger.debug("Stdout:\n%s", stdout[:MAX_LOGGED_CHARS])
+                    if stderr:
+                        logger.debug("Stderr:\n%s", stderr[:MAX_LOGGED_CHARS])
                 return {
                     "stdout": stdout,
                     "stderr": stderr,
@@ -98,7 +91,6 @@ class SandboxExecutionMixin:
         Returns:
             Dictionary containing stdout, stderr and exit_code
         """
-        logger = self._get_logger()
         
         # Verify if sandbox exists
         error = self.verify_sandbox_exists(sandbox_id)
@@ -112,13 +104,9 @@ class SandboxExecutionMixin:
         try:
             with self._get_running_sandbox(sandbox_id) as container:
                 logger.info(f"Executing command in sandbox {sandbox_id}: {command}")
-                exec_result = container.exec_run(command, stdout=True, stderr=True, stdin=False, tty=False, demux=True)
-                exit_code = exec_result.exit_code
-                stdout_bytes, stderr_bytes = exec_result.output
-                
-                stdout = stdout_bytes.decode(errors="replace") if stdout_bytes else ""
-                stderr = stderr_bytes.decode(errors="replace") if stderr_bytes else ""
-                
+                exit_code, stdout, stderr = self._retry_if_stale(
+                    sandbox_id, container, lambda: self._run_command(container, command)
+                )
                 return {
                     "stdout": stdout,
                     "stderr": stderr,
@@ -132,6 +120,155 @@ class SandboxExecutionMixin:
                 "exit_code": -1
             }
     
-    def _get_logger(self):
-        from mcp_sandbox.utils.config import logger
-        return logger
+    def _run_command(self, container, command: str) -> Tuple[int, str, str]:
+        """Run a terminal command on the container's shell channel or, failing that, its own exec"""
+        shareable = ShellChannel.can_run(command)
+        result = self._run_in_shell_channel(container, command) if shareable else None
+        if result is None:
+            # Detaching commands, and commands arriving while the channel is busy,
+            # get a one-shot exec so they can't hold up or pollute the channel;
+            # detaching ones are wrapped so their background jobs can't keep it open
+            if shareable:
+                cmd = ["/bin/sh", "-c", command]
+            else:
+                cmd = ["/bin/sh", "-c", DETACHED_COMMAND_WRAPPER, "sh", command]
+            return self._exec_streamed(container, cmd)
+        exit_code, stdout_bytes, stderr_bytes = result
+        
+        stdout = stdout_bytes.decode(errors="replace") if stdout_bytes else ""
+        stderr = stderr_bytes.decode(errors="replace") if stderr_bytes else ""
+        if len(stdout_bytes) + len(stderr_bytes) > MAX_OUTPUT_BYTES:
+            stdout += TRUNCATION_MARKER
+        return exit_code, stdout, stderr
+    
+    def _run_in_shell_channel(self, container, command: str) -> Optional[Tuple[int, bytes, bytes]]:
+        """Run a command on the container's shell channel, or return None if it is busy"""
+        try:
+            try:
+                return self._get_shell_channel(container).run(command, MAX_OUTPUT_BYTES, COMMAND_TIMEOUT)
+            except ShellChannelClosed:
+                # Stale channel (e.g. the container was restarted); the command never ran,
+                # and _get_shell_channel replaces the closed channel
+                return self._get_shell_channel(container).run(command, MAX_OUTPUT_BYTES, COMMAND_TIMEOUT)
+        except ShellChannelBusy:
+            return None
+
+    def _get_shell_channel(self, container) -> ShellChannel:
+        """Get the persistent shell channel for a container, opening one if needed"""
+        with self._state_lock:
+            channel = self._shell_channels.get(container.id)
+        if channel is not None and not channel.closed:
+            return channel
+        # Opening a channel takes two daemon round trips, so it happens outside the
+        # lock that every request's touch and install-status updates share
+        new_channel = ShellChannel(self.sandbox_client.api, container.id)
+        with self._state_lock:
+            channel = self._shell_channels.get(container.id)
+            if channel is None or channel.closed:
+                self._shell_channels[container.id] = new_channel
+                return new_channel
+        # Another request opened one in the meantime
+        new_channel.close()
+        return channel
+
+    def _exec_streamed(
+        self, container, cmd: Union[str, List[str]], workdir: str = "/app/results", stdin_data: Optional[bytes] = None,
+        timeout: float = COMMAND_TIMEOUT
+    ) -> Tuple[int, str, str]:
+        """Run a command in a container, streaming and decoding its output as it arrives
+        
+        Frames are decoded incrementally as UTF-8 (invalid bytes are replaced) and
+        reading stops once the combined size exceeds MAX_OUTPUT_BYTES, in which
+        case TRUNCATION_MARKER is appended to stdout. If the output has not ended
+        after `timeout` seconds the connection is closed and the output read so far
+        is returned with exit code -1 and a timeout note on stderr.
+        
+        Args:
+            container: The running sandbox container
+            cmd: The command to execute
+            workdir: Working directory inside the container
+            stdin_data: If given, written to the command's stdin, which is then closed
+            timeout: Seconds to wait for the command's output to end
+            
+        Returns:
+            Tuple of (exit_code, stdout, stderr)
+        """
+        api = self.sandbox_client.api
+        exec_id = api.exec_create(
+            container.id, cmd, stdout=True, stderr=True, stdin=stdin_data is not None,
+            workdir=workdir, privileged=False
+        )["Id"]
+        # Attach over a raw socket even without stdin, so the connection can be closed
+        # as soon as we stop reading
+        sock = api.exec_start(exec_id, socket=True)
+        # SocketIO wraps the real socket for unix transports; TLS hands back the socket itself
+        raw_sock = getattr(sock, "_sock", sock)
+        out_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        err_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        out: List[str] = []
+        err: List[str] = []
+        total = 0
+        truncated = False
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            # Wakes the frame reader, which blocks in poll() regardless of socket timeouts
+            try:
+                raw_sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        timer = threading.Timer(timeout, expire)
+        timer.daemon = True
+        try:
+            timer.start()
+            raw_sock.settimeout(None)
+            if stdin_data is not None:
+                raw_sock.sendall(stdin_data)
+                raw_sock.shutdown(socket.SHUT_WR)
+            frames = (
+                (data, None) if stream == STDOUT else (None, data)
+                for stream, data in frames_iter(sock, tty=False)
+            )
+            for stdout_chunk, stderr_chunk in frames:
+                if stdout_chunk:
+                    total += len(stdout_chunk)
+                    out.append(out_decoder.decode(stdout_chunk))
+                if stderr_chunk:
+                    total += len(stderr_chunk)
+                    err.append(err_decoder.decode(stderr_chunk))
+                if total > MAX_OUTPUT_BYTES:
+                    logger.warning(f"Output of exec in container {container.id} exceeded {MAX_OUTPUT_BYTES} bytes, truncating")
+                    truncated = True
+                    break
+        except OSError:
+            if not timed_out.is_set():
+                raise
+        finally:
+            timer.cancel()
+            # Close both layers so the descriptor is released now, not at GC; after a
+            # truncation the process gets EPIPE/SIGPIPE on its next write and exits
+            for sock_layer in (sock, raw_sock):
+                try:
+                    sock_layer.close()
+                except Exception:
+                    pass
+        out.append(out_decoder.decode(b"", final=True))
+        err.append(err_decoder.decode(b"", final=True))
+        if truncated:
+            out.append(TRUNCATION_MARKER)
+        if timed_out.is_set():
+            logger.warning(f"Exec in container {container.id} timed out after {timeout} seconds")
+            err.append(timeout_note(timeout))
+            return -1, "".join(out), "".join(err)
+        try:
+            exit_code = api.exec_inspect(exec_id).get("ExitCode")
+        except APIError as e:
+            # The command has run; an error here must not look like a failed start to callers
+            logger.warning(f"Failed to inspect exec in container {container.id}: {e}")
+            exit_code = None
+        # The process may still be running if we stopped reading early
+        if exit_code is None:
+            exit_code = -1
+        return exit_code, "".join(out), "".join(err)
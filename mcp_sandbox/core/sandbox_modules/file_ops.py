@@ -1,11 +1,14 @@
 from typing import List
+import os
 import tarfile
-import io
+import threading
 from pathlib import Path
+from urllib.parse import urlencode
+from mcp_sandbox.utils.config import logger, HOST, PORT
+from mcp_sandbox.db.database import db
 
 class SandboxFileOpsMixin:
     def list_files_in_sandbox(self, sandbox_id: str, directory: str = "/app/results", with_stat: bool = False) -> List:
-        from mcp_sandbox.utils.config import logger
         try:
             container, error = self.get_container_by_sandbox_id(sandbox_id)
             if error:
@@ -16,54 +19,66 @@ class SandboxFileOpsMixin:
                 logger.error(f"No container found for sandbox {sandbox_id}")
                 return []
                 
-            exec_result = container.exec_run(f"ls -1 {directory}")
+            # One find exec lists the directory (and ctimes) instead of ls plus a stat per file
+            fmt = "%p|%C@\\n" if with_stat else "%p\\n"
+            exec_result = container.exec_run(
+                ["find", directory.rstrip("/") or "/", "-mindepth", "1", "-maxdepth", "1", "-printf", fmt]
+            )
             if exec_result.exit_code != 0:
                 return []
                 
-            files = exec_result.output.decode().splitlines()
-            full_paths = [f"{directory.rstrip('/')}/{f}" for f in files]
+            lines = sorted(exec_result.output.decode(errors="replace").splitlines())
+            if not with_stat:
+                return lines
             
-            if with_stat:
-                stat_files = []
-                for f in full_paths:
-                    stat_result = container.exec_run(f'stat -c "%n|%Z" "{f}"')
-                    if stat_result.exit_code == 0:
-                        parts = stat_result.output.decode().strip().split("|", 1)
-                        if len(parts) == 2:
-                            stat_files.append((parts[0], int(parts[1])))
-                return stat_files
-            else:
-                return full_paths
+            stat_files = []
+            for line in lines:
+                path, sep, ctime = line.rpartition("|")
+                if sep:
+                    stat_files.append((path, int(float(ctime))))
+            return stat_files
         except Exception as e:
-            from mcp_sandbox.utils.config import logger
             logger.error(f"Failed to list files in sandbox {sandbox_id}: {e}")
+            self._uncache_container(sandbox_id)
             return []
 
+    def _list_new_files(self, container, since_ts: float, directory: str = "/app/results") -> List[str]:
+        """List regular files in a directory whose status changed after a unix timestamp
+        
+        The filter runs inside the container, so only new files cross the Docker API.
+        """
+        exec_result = container.exec_run(
+            ["find", directory, "-maxdepth", "1", "-mindepth", "1", "-type", "f", "-newerct", f"@{since_ts:.9f}", "-printf", "%p\\n"]
+        )
+        if exec_result.exit_code != 0:
+            return []
+        return sorted(exec_result.output.decode(errors="replace").splitlines())
+
     def get_file_link(self, sandbox_id: str, file_path: str) -> str:
-        from mcp_sandbox.utils.config import HOST, PORT
-        from mcp_sandbox.db.database import db
-        # import ipdb
-        # ipdb.set_trace()
-        # graduate student
-        base_url = f"http://{config.get('server', {}).get('host', 'localhost')}:{config.get('server', {}).get('port', 8000)}"
-        api_key = config.get('API_KEY',None)
+        return self.get_file_links(sandbox_id, [file_path])[0]
+
+    def get_file_links(self, sandbox_id: str, file_paths: List[str]) -> List[str]:
+        """Build download links for several files of one sandbox
+        
+        The base URL and the owner's API key are resolved once for the whole batch.
+        """
         sandbox = db.get_sandbox(sandbox_id)
-        api_key = None
-        if sandbox and sandbox.get("user_id"):
-            user_id = sandbox.get("user_id")
-            user = db.get_user(user_id=user_id)
-            if user:
-                api_key = user.get("api_key")
+        user_id = sandbox.get("user_id") if sandbox else None
+        user = db.get_user(user_id=user_id) if user_id else None
+        api_key = user.get("api_key") if user else None
 
-        # Build URL with optional API key
-        url = f"{base_url}/sandbox/file?sandbox_id={sandbox_id}&file_path={file_path}"
+        # Build URLs with optional API key
+        base_url = f"http://{HOST}:{PORT}/sandbox/file?"
+        params = {"sandbox_id": sandbox_id, "file_path": ""}
         if api_key:
-            url += f"&api_key={api_key}"
-
-        return url
+            params["api_key"] = api_key
+        links = []
+        for file_path in file_paths:
+            params["file_path"] = file_path
+            links.append(base_url + urlencode(params))
+        return links
 
     def upload_file_to_sandbox(self, sandbox_id: str, local_file_path: str, dest_path: str = "/app/results") -> dict:
-        from mcp_sandbox.utils.config import logger
         error = self.verify_sandbox_exists(sandbox_id)
         if error:
             return error
@@ -72,12 +87,48 @@ class SandboxFileOpsMixin:
                 local_file = Path(local_file_path)
                 if not local_file.exists():
                     return {"error": True, "message": f"Local file not found: {local_file_path}"}
-                tar_stream = io.BytesIO()
-                with tarfile.open(fileobj=tar_stream, mode="w") as tar:
-                    tar.add(str(local_file), arcname=local_file.name)
-                tar_stream.seek(0)
-                sandbox.put_archive(dest_path, tar_stream.read())
+                sandbox.put_archive(dest_path, self._stream_tar(local_file))
                 return {"success": True, "message": f"Uploaded {local_file.name} to {dest_path} in sandbox {sandbox_id}"}
         except Exception as e:
             logger.error(f"Failed to upload file to sandbox {sandbox_id}: {e}", exc_info=True)
             return {"error": True, "message": str(e)}
+
+    @staticmethod
+    def _stream_tar(local_file: Path, chunk_size: int = 1 << 16):
+        """Yield a tar archive of a local file or directory chunk by chunk
+        
+        A writer thread feeds the archive through a pipe, so the upload is sent
+        as it is built instead of being assembled in memory first.
+        """
+        read_fd, write_fd = os.pipe()
+        errors = []
+
+        def write_archive():
+            try:
+                with os.fdopen(write_fd, "wb") as writer:
+                    with tarfile.open(fileobj=writer, mode="w|") as tar:
+                        if local_file.is_file():
+                            # Single file: one stat and a plain sequential read
+                            st = local_file.stat()
+                            info = tarfile.TarInfo(name=local_file.name)
+                            info.size = st.st_size
+                            info.mtime = st.st_mtime
+                            info.mode = st.st_mode & 0o777
+                            with local_file.open("rb") as fp:
+                                tar.addfile(info, fp)
+                        else:
+                            tar.add(str(local_file), arcname=local_file.name)
+            except Exception as e:
+                errors.append(e)
+
+        writer_thread = threading.Thread(target=write_archive, name="tar-upload", daemon=True)
+        writer_thread.start()
+        try:
+            with os.fdopen(read_fd, "rb") as reader:
+                while chunk := reader.read(chunk_size):
+                    yield chunk
+        finally:
+            # Closing the reader unblocks the writer if the upload was abandoned early
+            writer_thread.join()
+        if errors:
+            raise errors[0]
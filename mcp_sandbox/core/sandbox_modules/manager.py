@@ -1,33 +1,145 @@
-import uuid
+import secrets
 import json
 from datetime import datetime
-from typing import Dict, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Set, Tuple, TypeVar
 from pathlib import Path
 import hashlib
+import os
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict
 from contextlib import contextmanager
-from mcp_sandbox.utils.config import logger, DEFAULT_DOCKER_IMAGE, config
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from mcp_sandbox.utils.config import logger, DEFAULT_DOCKER_IMAGE, DOCKER_API_POOL_SIZE, INSTALL_WORKERS, config
 from mcp_sandbox.db.database import db
+from mcp_sandbox.core.sandbox_modules.pool import WarmSandboxPool
 import docker
+from docker.utils.build import exclude_paths
+
+# Upper bounds for in-memory tracking state, evicted least-recently-used first
+MAX_TRACKED_SANDBOXES = 4096
+MAX_INSTALL_STATUSES = 4096
+# Seconds a resolved Container handle is reused before it is inspected again
+CONTAINER_CACHE_TTL = 5
+# Seconds create_sandbox waits for a missing image to finish building
+IMAGE_BUILD_TIMEOUT = 600
+# Extra label on warm pool containers, valued "<hostname>:<pid>" of the process that
+# created them, so ones left behind by a crash can be found and told apart from the
+# live pools of other processes sharing the Docker daemon
+WARM_POOL_LABEL = "python-sandbox.warm-pool"
+# Name prefix of warm containers; leasing renames them to a plain sandbox name, since
+# labels can't be changed on an existing container
+WARM_CONTAINER_PREFIX = "python-sandbox-warm-"
+
+T = TypeVar("T")
+
+# image name -> Event set when its background build ends, shared by every SandboxManager
+_image_builds: Dict[str, threading.Event] = {}
+_image_builds_lock = threading.Lock()
+# Images already checked or built by this process; later SandboxManagers skip the probe
+_ensured_images: Set[str] = set()
+
+@lru_cache(maxsize=None)
+def get_docker_client() -> docker.DockerClient:
+    """Return the process-wide Docker client
+    
+    Every SandboxManager shares it, so requests reuse one pool of keep-alive
+    connections to the daemon, sized for concurrent request and worker threads.
+    """
+    return docker.from_env(max_pool_size=DOCKER_API_POOL_SIZE)
 
 class SandboxManager:
     """Manage Sandboxes with automatic creation"""
     def __init__(self, base_image: str = DEFAULT_DOCKER_IMAGE):
         self.base_image = base_image
-        self.sandbox_last_used: Dict[str, datetime] = {}
+        # container_id -> unix timestamp of last use
+        self.sandbox_last_used: OrderedDict[str, float] = OrderedDict()
         self.session_sandbox_map: Dict[str, str] = {}
-        self.package_install_status: Dict[str, Dict[str, Any]] = {}
+        self.package_install_status: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        # sandbox_id -> (monotonic timestamp, parsed installed-package list)
+        self._pkg_cache: OrderedDict[str, Tuple[float, list]] = OrderedDict()
+        # Guards writes to the tracking dicts above, which request handlers and
+        # install worker threads update concurrently
+        self._state_lock = threading.RLock()
+        # Matches the label in _container_create_kwargs on both key and value
+        self._label_filter = {"label": "python-sandbox=true"}
+        # sandbox_id -> (monotonic fetch time, Container), see get_container_by_sandbox_id
+        self._container_cache: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        # container_id -> persistent shell used by execute_terminal_command
+        self._shell_channels: Dict[str, Any] = {}
+        # Set by enable_warm_pool; only the long-lived MCP environment keeps one
+        self.warm_pool = None
+        self._install_pool = ThreadPoolExecutor(max_workers=INSTALL_WORKERS, thread_name_prefix="pip-install")
         try:
-            self.sandbox_client = docker.from_env()
+            self.sandbox_client = get_docker_client()
             logger.info("Sandbox client initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Sandbox client: {e}", exc_info=True)
             raise
+        # Options shared by every sandbox container, built once instead of per create_sandbox call
+        self._container_create_kwargs = {
+            "detach": True,
+            "working_dir": "/app/results",
+            "labels": {"python-sandbox": "true"},
+            "host_config": self.sandbox_client.api.create_host_config(
+                mem_limit='1g',
+                memswap_limit='1g',
+                network_mode='bridge',
+                privileged=False,
+                cap_drop=['ALL'],
+                security_opt=['no-new-privileges'],
+            ),
+        }
+        # Set by _ensure_sandbox_image when there is no image until a background build ends
+        self._image_ready: Optional[threading.Event] = None
         self._ensure_sandbox_image()
         self._load_sandbox_records()
         logger.info(f"SandboxManager initialized, using base image: {self.base_image}")
 
+    def _touch_sandbox(self, container_id: str) -> None:
+        """Record that a sandbox container was used, evicting the oldest entries past the cap"""
+        with self._state_lock:
+            self.sandbox_last_used[container_id] = time.time()
+            self.sandbox_last_used.move_to_end(container_id)
+            while len(self.sandbox_last_used) > MAX_TRACKED_SANDBOXES:
+                self.sandbox_last_used.popitem(last=False)
+
     def _ensure_sandbox_image(self):
-        """Ensure our custom Sandbox image exists, build it if needed"""
+        """Ensure our custom Sandbox image exists, building it in the background if needed
+        
+        The build runs on a daemon thread so the constructor returns right away.
+        While an outdated image is rebuilt, new sandboxes keep using it; if there
+        is no image at all, create_sandbox waits for the build to finish.
+        """
+        if DEFAULT_DOCKER_IMAGE in _ensured_images:
+            return
+        image_exists, need_rebuild = self._check_sandbox_image()
+        if not need_rebuild:
+            if image_exists:
+                with _image_builds_lock:
+                    _ensured_images.add(DEFAULT_DOCKER_IMAGE)
+            return
+        with _image_builds_lock:
+            build_done = _image_builds.get(DEFAULT_DOCKER_IMAGE)
+            # Share a build another SandboxManager already started
+            if build_done is None or build_done.is_set():
+                build_done = threading.Event()
+                _image_builds[DEFAULT_DOCKER_IMAGE] = build_done
+                threading.Thread(
+                    target=self._build_sandbox_image, args=(build_done,), name="sandbox-image-build", daemon=True
+                ).start()
+        if not image_exists:
+            self._image_ready = build_done
+
+    def _check_sandbox_image(self) -> Tuple[bool, bool]:
+        """Check whether the Sandbox image exists and whether it has to be (re)built
+        
+        Returns:
+            Tuple of (image_exists, need_rebuild)
+        """
         custom_image_name = DEFAULT_DOCKER_IMAGE
         sandboxfile_path = Path(config["docker"].get("dockerfile_path", "Dockerfile")).resolve()
         build_info_file = Path(config["docker"].get("build_info_file", ".docker_build_info")).resolve()
@@ -41,48 +153,112 @@ class SandboxManager:
             logger.info(f"Sandbox image not found: {custom_image_name}")
         need_rebuild = not image_exists
         if image_exists and check_changes and sandboxfile_path.exists():
-            current_hash = self._get_file_hash(sandboxfile_path)
-            previous_hash = None
-            if build_info_file.exists():
-                try:
-                    with open(build_info_file, 'r') as f:
-                        build_info = json.load(f)
-                        previous_hash = build_info.get('dockerfile_hash')
-                        logger.info(f"Found previous build info with hash: {previous_hash}")
-                except (json.JSONDecodeError, IOError) as e:
-                    logger.warning(f"Could not read build info file: {e}")
+            build_info = self._read_build_info(build_info_file)
+            previous_hash = build_info.get('context_hash')
+            if previous_hash:
+                logger.info(f"Found previous build info with context hash: {previous_hash}")
+            context_state = self._get_context_state(sandboxfile_path)
+            # Reuse the stored hash when no file's path, size or mtime changed,
+            # unless an mtime is in the future and therefore can't be trusted
+            now_ns = time.time_ns()
+            if (previous_hash
+                    and build_info.get('context_state') == context_state
+                    and all(mtime_ns <= now_ns for _, _, mtime_ns in context_state)):
+                current_hash = previous_hash
+                logger.info("Build context mtimes and sizes unchanged, skipping hash")
+            else:
+                current_hash = self._get_context_hash(sandboxfile_path.parent, context_state)
             if previous_hash != current_hash:
-                logger.info(f"Sandboxfile has changed (Previous: {previous_hash}, Current: {current_hash})")
+                logger.info(f"Build context has changed (Previous: {previous_hash}, Current: {current_hash})")
                 need_rebuild = True
-        if need_rebuild:
-            if not sandboxfile_path.exists():
-                logger.error("Sandboxfile not found, falling back to base image")
-                return
-            try:
-                logger.info(f"Building Sandbox image: {custom_image_name}")
-                _, logs = self.sandbox_client.images.build(
-                    path=str(sandboxfile_path.parent),
-                    dockerfile=str(sandboxfile_path.name),
-                    tag=custom_image_name,
-                    rm=True,
-                    forcerm=True
-                )
-                for log in logs:
-                    if 'stream' in log:
-                        logger.info(log['stream'].strip())
-                if check_changes:
-                    build_info = {
-                        'dockerfile_hash': self._get_file_hash(sandboxfile_path),
-                        'build_time': datetime.now().isoformat(),
-                        'image_name': custom_image_name
-                    }
-                    with open(build_info_file, 'w') as f:
-                        json.dump(build_info, f)
-                        logger.info(f"Saved build info to {build_info_file}")
-                self.base_image = custom_image_name
-                logger.info(f"Successfully built Sandbox image: {custom_image_name}")
-            except Exception as e:
-                logger.error(f"Failed to build Sandbox image: {e}", exc_info=True)
+        if need_rebuild and not sandboxfile_path.exists():
+            logger.error("Sandboxfile not found, falling back to base image")
+            need_rebuild = False
+        return image_exists, need_rebuild
+
+    def _build_sandbox_image(self, build_done: threading.Event) -> None:
+        """Build the Sandbox image and record its build info, then set `build_done`"""
+        custom_image_name = DEFAULT_DOCKER_IMAGE
+        sandboxfile_path = Path(config["docker"].get("dockerfile_path", "Dockerfile")).resolve()
+        build_info_file = Path(config["docker"].get("build_info_file", ".docker_build_info")).resolve()
+        check_changes = config["docker"].get("check_dockerfile_changes", True)
+        try:
+            logger.info(f"Building Sandbox image: {custom_image_name}")
+            # Low-level build: chunks are handled as they arrive instead of being collected first
+            logs = self.sandbox_client.api.build(
+                path=str(sandboxfile_path.parent),
+                dockerfile=str(sandboxfile_path.name),
+                tag=custom_image_name,
+                rm=True,
+                forcerm=True,
+                decode=True
+            )
+            for chunk in logs:
+                if 'error' in chunk or 'errorDetail' in chunk:
+                    reason = chunk.get('error') or chunk['errorDetail'].get('message')
+                    raise docker.errors.BuildError(reason, [chunk])
+                stream = chunk.get('stream')
+                if stream and (line := stream.rstrip()):
+                    logger.debug("%s", line)
+            if check_changes:
+                context_state = self._get_context_state(sandboxfile_path)
+                build_info = {
+                    'context_hash': self._get_context_hash(sandboxfile_path.parent, context_state),
+                    'context_state': context_state,
+                    'build_time': datetime.now().isoformat(),
+                    'image_name': custom_image_name
+                }
+                with open(build_info_file, 'w') as f:
+                    json.dump(build_info, f)
+                    logger.info(f"Saved build info to {build_info_file}")
+            self.base_image = custom_image_name
+            with _image_builds_lock:
+                _ensured_images.add(custom_image_name)
+            logger.info(f"Successfully built Sandbox image: {custom_image_name}")
+        except Exception as e:
+            logger.error(f"Failed to build Sandbox image: {e}", exc_info=True)
+        finally:
+            build_done.set()
+
+    def _read_build_info(self, build_info_file: Path) -> Dict[str, Any]:
+        """Read the persisted build info, returning an empty dict if unavailable"""
+        if not build_info_file.exists():
+            return {}
+        try:
+            with open(build_info_file, 'r') as f:
+                return json.load(f)
+        except (ValueError, IOError) as e:
+            logger.warning(f"Could not read build info file: {e}")
+            return {}
+
+    def _get_context_state(self, dockerfile_path: Path) -> List[List[Any]]:
+        """List [path, size, mtime_ns] for each file Docker sends as the build context
+        
+        Paths are relative to the Dockerfile's directory and filtered by its
+        .dockerignore the same way images.build filters them.
+        """
+        context_dir = dockerfile_path.parent
+        patterns = []
+        dockerignore = context_dir / ".dockerignore"
+        if dockerignore.exists():
+            patterns = [
+                line.strip() for line in dockerignore.read_text().splitlines()
+                if line.strip() and not line.strip().startswith("#")
+            ]
+        state = []
+        for rel_path in sorted(exclude_paths(str(context_dir), patterns, dockerfile=dockerfile_path.name)):
+            file_path = context_dir / rel_path
+            if file_path.is_file():
+                file_stat = file_path.stat()
+                state.append([rel_path, file_stat.st_size, file_stat.st_mtime_ns])
+        return state
+
+    def _get_context_hash(self, context_dir: Path, context_state: List[List[Any]]) -> str:
+        """Calculate a SHA256 over the path and content of every build context file"""
+        digest = hashlib.sha256()
+        for rel_path, _, _ in context_state:
+            digest.update(f"{rel_path}\0{self._get_file_hash(context_dir / rel_path)}\n".encode())
+        return digest.hexdigest()
 
     def _get_file_hash(self, file_path: Path) -> str:
         """Calculate SHA256 hash of a file to detect changes"""
@@ -90,8 +266,7 @@ class SandboxManager:
             return ""
         try:
             with open(file_path, 'rb') as f:
-                file_hash = hashlib.sha256(f.read()).hexdigest()
-            return file_hash
+                return hashlib.file_digest(f, 'sha256').hexdigest()
         except IOError as e:
             logger.error(f"Error reading file for hashing: {e}")
             return ""
@@ -99,40 +274,187 @@ class SandboxManager:
     def _load_sandbox_records(self) -> None:
         """Load existing sandbox usage records"""
         try:
-            sandboxes = self.sandbox_client.containers.list(all=True, filters={"label": "python-sandbox"})
-            for sandbox in sandboxes:
-                sandbox_id = sandbox.id
-                self.sandbox_last_used[sandbox_id] = datetime.now()
-                logger.info(f"Loaded existing sandbox: {sandbox_id}")
+            # Raw listing: one daemon call, no per-container inspect
+            sandboxes = self.sandbox_client.api.containers(all=True, filters=self._label_filter)
+            now = time.time()
+            with self._state_lock:
+                self.sandbox_last_used.update((sandbox["Id"], now) for sandbox in sandboxes)
+                while len(self.sandbox_last_used) > MAX_TRACKED_SANDBOXES:
+                    self.sandbox_last_used.popitem(last=False)
+            logger.info(f"Loaded {len(sandboxes)} existing sandboxes")
         except Exception as e:
             logger.error(f"Failed to load existing sandboxes: {e}", exc_info=True)
 
-    def create_sandbox(self) -> str:
-        """Create a new Sandbox container and return its Docker container ID"""
-        sandbox_name = f"python-sandbox-{str(uuid.uuid4())[:8]}"
+    def create_sandbox(self, warm: bool = False) -> str:
+        """Create a new Sandbox container and return its Docker container ID
+        
+        Args:
+            warm: Name and label the container as a warm pool container
+        """
+        sandbox_name = f"{WARM_CONTAINER_PREFIX if warm else 'python-sandbox-'}{secrets.token_hex(4)}"
+        if self._image_ready is not None and not self._image_ready.wait(timeout=IMAGE_BUILD_TIMEOUT):
+            logger.warning(f"Sandbox image build still running after {IMAGE_BUILD_TIMEOUT}s")
         try:
-            sandbox = self.sandbox_client.containers.create(
-                image=self.base_image,
-                name=sandbox_name,
-                detach=True,
-                working_dir='/app/results',
-                labels={"python-sandbox": "true"},
-                mem_limit='1g',
-                memswap_limit='1g',
-                network_mode='bridge',
-                privileged=False,
-                cap_drop=['ALL'],
-                security_opt=['no-new-privileges'],
-            )
-            sandbox.start()
-            docker_container_id = sandbox.id
+            # Low-level calls: containers.create would inspect the new container
+            # just to build a Container object we never use
+            api = self.sandbox_client.api
+            create_kwargs = self._container_create_kwargs
+            if warm:
+                labels = {**create_kwargs["labels"], WARM_POOL_LABEL: self._warm_pool_owner()}
+                create_kwargs = {**create_kwargs, "labels": labels}
+            docker_container_id = api.create_container(
+                image=self.base_image, name=sandbox_name, **create_kwargs
+            )["Id"]
+            api.start(docker_container_id)
             logger.info(f"Created new sandbox: {docker_container_id} (name: {sandbox_name})")
-            self.sandbox_last_used[docker_container_id] = datetime.now()
+            self._touch_sandbox(docker_container_id)
             return docker_container_id
         except Exception as e:
             logger.error(f"Failed to create sandbox: {e}", exc_info=True)
             raise
             
+    def enable_warm_pool(self, size: int, ttl: float = 300) -> None:
+        """Keep `size` started containers ready so create_user_sandbox can skip a cold start
+        
+        Warm containers left behind by dead processes on this host are removed
+        when the pool starts; with `size` 0 nothing is created or removed.
+        """
+        if self.warm_pool is not None or size <= 0:
+            return
+        self._remove_orphaned_warm_containers()
+        self.warm_pool = WarmSandboxPool(
+            self._create_warm_container, self._remove_container, self._container_is_running, size, ttl
+        )
+        self.warm_pool.start()
+
+    def _create_warm_container(self) -> str:
+        return self.create_sandbox(warm=True)
+
+    @staticmethod
+    def _warm_pool_owner() -> str:
+        """WARM_POOL_LABEL value for containers created by this process"""
+        # Read per call rather than at import, so forked workers label with their own pid
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def _is_orphaned_warm_owner(owner: str) -> bool:
+        """Whether a WARM_POOL_LABEL value names a process on this host that has exited"""
+        host, _, pid = owner.rpartition(":")
+        if host != socket.gethostname() or not pid.isdigit():
+            # Another host's pool, or a label we don't understand: not ours to judge
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            # Exists but belongs to another user
+            return False
+        return False
+
+    def _container_is_running(self, container_id: str) -> bool:
+        """Inspect a container and report whether it is running; False if it is gone"""
+        try:
+            return bool(self.sandbox_client.api.inspect_container(container_id)["State"]["Running"])
+        except Exception as e:
+            logger.warning(f"Failed to inspect container {container_id}: {e}")
+            return False
+
+    def _remove_orphaned_warm_containers(self) -> None:
+        """Remove unleased warm containers whose creating process on this host has exited"""
+        try:
+            leftovers = self.sandbox_client.api.containers(all=True, filters={"label": WARM_POOL_LABEL})
+        except Exception as e:
+            logger.error(f"Failed to list leftover warm sandboxes: {e}", exc_info=True)
+            return
+        for summary in leftovers:
+            container_id = summary["Id"]
+            owner = (summary.get("Labels") or {}).get(WARM_POOL_LABEL, "")
+            names = summary.get("Names") or []
+            # Leased containers were renamed away from the warm prefix and belong to a sandbox
+            still_warm = any(name.lstrip("/").startswith(WARM_CONTAINER_PREFIX) for name in names)
+            if not still_warm or not self._is_orphaned_warm_owner(owner):
+                continue
+            if db.get_sandbox_by_container_id(container_id):
+                continue
+            logger.info(f"Removing leftover warm sandbox {container_id}")
+            try:
+                self._remove_container(container_id)
+            except Exception as e:
+                logger.warning(f"Failed to remove leftover warm sandbox {container_id}: {e}")
+
+    def _remove_container(self, container_id: str) -> None:
+        """Force-remove a container by ID and stop tracking it"""
+        self._close_shell_channel(container_id)
+        self._forget_container_handle(container_id)
+        self.sandbox_client.api.remove_container(container_id, force=True)
+        with self._state_lock:
+            self.sandbox_last_used.pop(container_id, None)
+
+    def _forget_container_handle(self, container_id: str) -> None:
+        """Drop cached Container handles for a container"""
+        with self._state_lock:
+            for sandbox_id, (_, container) in list(self._container_cache.items()):
+                if container.id == container_id:
+                    del self._container_cache[sandbox_id]
+
+    def _get_cached_container(self, sandbox_id: str):
+        """Return the cached Container handle for a sandbox if it is still fresh"""
+        with self._state_lock:
+            cached = self._container_cache.get(sandbox_id)
+            if cached is None:
+                return None
+            if time.monotonic() - cached[0] < CONTAINER_CACHE_TTL:
+                return cached[1]
+            del self._container_cache[sandbox_id]
+        return None
+
+    def _cache_container(self, sandbox_id: str, container) -> None:
+        """Cache a Container handle, evicting the least recently resolved entries past the cap"""
+        with self._state_lock:
+            self._container_cache[sandbox_id] = (time.monotonic(), container)
+            self._container_cache.move_to_end(sandbox_id)
+            while len(self._container_cache) > MAX_TRACKED_SANDBOXES:
+                self._container_cache.popitem(last=False)
+
+    def _uncache_container(self, sandbox_id: str) -> None:
+        """Drop a sandbox's cached Container handle, e.g. when it may be stale"""
+        with self._state_lock:
+            self._container_cache.pop(sandbox_id, None)
+
+    def drop_sandbox_caches(self, sandbox_id: str) -> None:
+        """Drop the handle and package list cached under a sandbox's database ID"""
+        with self._state_lock:
+            self._container_cache.pop(sandbox_id, None)
+            self._pkg_cache.pop(sandbox_id, None)
+
+    def _close_shell_channel(self, container_id: str) -> None:
+        """Close and forget the persistent shell channel of a container, if any"""
+        with self._state_lock:
+            channel = self._shell_channels.pop(container_id, None)
+        if channel is not None:
+            channel.close()
+
+    def _lease_container(self) -> str:
+        """Take a warm container from the pool if one is ready, otherwise create one"""
+        if self.warm_pool is not None:
+            container_id = self.warm_pool.lease()
+            if container_id:
+                # Drop the warm name so no pool reaper mistakes it for an unleased container
+                try:
+                    self.sandbox_client.api.rename(container_id, f"python-sandbox-{secrets.token_hex(4)}")
+                except Exception as e:
+                    logger.warning(f"Failed to rename leased warm sandbox {container_id}: {e}")
+                    try:
+                        self._remove_container(container_id)
+                    except Exception as e:
+                        logger.warning(f"Failed to remove warm sandbox {container_id}: {e}")
+                    return self.create_sandbox()
+                logger.info(f"Leased warm sandbox container: {container_id}")
+                self._touch_sandbox(container_id)
+                return container_id
+        return self.create_sandbox()
+
     def create_user_sandbox(self, user_id: Optional[str] = None, name: Optional[str] = None) -> dict:
         """Create a new sandbox for a user, with database record and Docker container
         
@@ -167,15 +489,17 @@ class SandboxManager:
         
         # Create the sandbox and get container ID
         try:
-            # 1. Create the Docker container (internal implementation detail)
-            docker_container_id = self.create_sandbox()
+            # 1. Lease or create the Docker container (internal implementation detail)
+            docker_container_id = self._lease_container()
             
             # 2. Create database record, linking container ID
             sandbox_id = db.create_sandbox(user_id, name, docker_container_id)
             logger.info(f"Created sandbox with ID: {sandbox_id} (container ID: {docker_container_id})")
             
-            # 3. Return only sandbox_id related info, don't expose container ID
-            sandbox_name = name or f"Sandbox {len(db.get_user_sandboxes(user_id))}"
+            # 3. Return only sandbox_id related info, don't expose container ID. The default
+            # name is chosen by the insert itself, so read back what was stored
+            sandbox_record = db.get_sandbox(sandbox_id)
+            sandbox_name = sandbox_record["name"] if sandbox_record else name
             return {
                 "sandbox_id": sandbox_id, 
                 "user_id": user_id,
@@ -186,8 +510,8 @@ class SandboxManager:
             logger.error(f"Error creating sandbox: {e}", exc_info=True)
             return {"error": True, "message": str(e)}
 
-    def get_container_by_sandbox_id(self, sandbox_id: str):
-        """Get the container associated with a sandbox ID"""
+    def _get_container_id(self, sandbox_id: str):
+        """Look up the Docker container ID recorded for a sandbox ID"""
         # Get sandbox record from database
         sandbox_record = db.get_sandbox(sandbox_id)
         if not sandbox_record:
@@ -199,13 +523,30 @@ class SandboxManager:
         if not container_id:
             logger.warning(f"[get_container_by_sandbox_id] No container ID for sandbox: {sandbox_id}")
             return None, {"error": True, "message": f"No container ID for sandbox: {sandbox_id}"}
+        return container_id, None
+
+    def get_container_by_sandbox_id(self, sandbox_id: str):
+        """Get the container associated with a sandbox ID
+        
+        Handles are cached for CONTAINER_CACHE_TTL seconds, so back-to-back
+        calls for the same sandbox skip the database lookup and the inspect.
+        """
+        container = self._get_cached_container(sandbox_id)
+        if container is not None:
+            self._touch_sandbox(container.id)
+            return container, None
+        
+        container_id, error = self._get_container_id(sandbox_id)
+        if error:
+            return None, error
         
         # Get Docker container
         try:
             logger.debug(f"[get_container_by_sandbox_id] Getting container {container_id} for sandbox {sandbox_id}")
             container = self.sandbox_client.containers.get(container_id)
+            self._cache_container(sandbox_id, container)
             # Update last used time
-            self.sandbox_last_used[container_id] = datetime.now()
+            self._touch_sandbox(container_id)
             return container, None
         except docker.errors.NotFound:
             logger.error(f"[get_container_by_sandbox_id] Container {container_id} not found for sandbox {sandbox_id}")
@@ -216,87 +557,63 @@ class SandboxManager:
 
     def verify_sandbox_exists(self, sandbox_id: str) -> Optional[Dict[str, Any]]:
         """Verify if sandbox exists, using sandbox_id instead of container ID"""
-        container, error = self.get_container_by_sandbox_id(sandbox_id)
+        container = self._get_cached_container(sandbox_id)
+        if container is not None:
+            self._touch_sandbox(container.id)
+            return None
+        container_id, error = self._get_container_id(sandbox_id)
         if error:
             return error
+        # Cache the inspected handle, so the get_container_by_sandbox_id call
+        # that usually follows a verification does not inspect again
+        try:
+            attrs = self.sandbox_client.api.inspect_container(container_id)
+            self._cache_container(sandbox_id, self.sandbox_client.containers.prepare_model(attrs))
+        except docker.errors.NotFound:
+            logger.error(f"[verify_sandbox_exists] Container {container_id} not found for sandbox {sandbox_id}")
+            return {"error": True, "message": f"Container not found for sandbox: {sandbox_id}"}
+        except Exception as e:
+            logger.error(f"[verify_sandbox_exists] Error inspecting container for sandbox {sandbox_id}: {e}", exc_info=True)
+            return {"error": True, "message": str(e)}
+        self._touch_sandbox(container_id)
         return None
 
     def delete_sandbox(self, sandbox_id: str) -> Dict[str, Any]:
         """Delete a sandbox container and cleanup resources"""
         try:
             # Find containers that might match this sandbox ID
-            logger.info(f"Looking for containers matching sandbox ID: {sandbox_id}")
-            
-            # Get all containers including stopped ones
-            all_containers = self.sandbox_client.containers.list(all=True)
-            logger.info(f"Found {len(all_containers)} total containers")
-            
-            # Find containers by ID or name matching the sandbox ID
-            containers_to_delete = []
-            for container in all_containers:
-                container_id = container.id
-                container_name = container.name
-                container_labels = container.labels
-                
-                # Check if this container matches our sandbox ID in any way
-                if any([
-                    # Exact ID match
-                    container_id == sandbox_id,
-                    # ID prefix match (Docker sometimes uses short IDs)
-                    container_id.startswith(sandbox_id),
-                    # Name contains the sandbox ID
-                    sandbox_id in container_name,
-                    # Sandbox ID in labels
-                    container_labels.get("sandbox_id") == sandbox_id,
-                    # The container name follows our naming convention
-                    container_name.startswith("python-sandbox-") and sandbox_id in container_name
-                ]):
-                    containers_to_delete.append(container)
-                    logger.info(f"Found container to delete: ID={container_id}, Name={container_name}")
+            logger.debug("Looking for containers matching sandbox ID: %s", sandbox_id)
             
+            # Callers pass the container ID recorded for the sandbox, so resolve it directly
+            try:
+                container = self.sandbox_client.containers.get(sandbox_id)
+                containers_to_delete = [container] if container.labels.get("python-sandbox") == "true" else []
+            except docker.errors.NotFound:
+                # Fall back to sandbox containers whose name carries the ID, letting the
+                # daemon do the matching; only the matches are inspected
+                filters = {**self._label_filter, "name": re.escape(sandbox_id)}
+                matched_ids = {
+                    summary["Id"] for summary in self.sandbox_client.api.containers(all=True, filters=filters)
+                }
+                containers_to_delete = [self.sandbox_client.containers.get(container_id) for container_id in matched_ids]
             # If no containers found, just clean up tracking data
             if not containers_to_delete:
                 logger.warning(f"No containers found matching sandbox ID: {sandbox_id}")
                 # Clean up tracking data anyway
-                if sandbox_id in self.sandbox_last_used:
-                    del self.sandbox_last_used[sandbox_id]
-                    logger.info(f"Removed sandbox {sandbox_id} from tracking dict")
-                
-                # Remove from session mapping if present
-                for session_id, sb_id in list(self.session_sandbox_map.items()):
-                    if sb_id == sandbox_id:
-                        del self.session_sandbox_map[session_id]
-                        logger.info(f"Removed sandbox {sandbox_id} from session mapping")
+                self._forget_sandbox(sandbox_id)
                 
                 return {"success": True, "message": f"No containers found for sandbox {sandbox_id}, but removed from tracking"}
             
-            # Delete all matching containers
-            for container in containers_to_delete:
-                logger.info(f"Processing container: ID={container.id}, Name={container.name}, Status={container.status}")
-                
-                try:
-                    # Stop the container if it's running
-                    if container.status == "running":
-                        logger.info(f"Stopping container {container.id}...")
-                        container.stop(timeout=0)
-                    
-                    # Remove the container
-                    logger.info(f"Removing container {container.id}...")
-                    container.remove(force=True)
-                    logger.info(f"Successfully removed container {container.id}")
-                except Exception as container_error:
-                    logger.error(f"Error removing container {container.id}: {str(container_error)}", exc_info=True)
+            # Delete all matching containers, overlapping the daemon round-trips when there are several
+            if len(containers_to_delete) == 1:
+                self._stop_and_remove(containers_to_delete[0])
+            else:
+                with ThreadPoolExecutor(max_workers=min(8, len(containers_to_delete))) as executor:
+                    list(executor.map(self._stop_and_remove, containers_to_delete))
             
             # Clean up tracking data
-            if sandbox_id in self.sandbox_last_used:
-                del self.sandbox_last_used[sandbox_id]
-                logger.info(f"Removed sandbox {sandbox_id} from tracking dict")
-            
-            # Remove from session mapping if present
-            for session_id, sb_id in list(self.session_sandbox_map.items()):
-                if sb_id == sandbox_id:
-                    del self.session_sandbox_map[session_id]
-                    logger.info(f"Removed sandbox {sandbox_id} from session mapping")
+            self._forget_sandbox(sandbox_id)
+            logger.info(f"Deleted sandbox {sandbox_id} ({len(containers_to_delete)} containers removed)")
             
             return {"success": True, "message": f"Sandbox {sandbox_id} deleted successfully ({len(containers_to_delete)} containers removed)"}
         
@@ -306,17 +623,53 @@ class SandboxManager:
             
             # Even if there's an error, try to clean up tracking data
             try:
-                if sandbox_id in self.sandbox_last_used:
-                    del self.sandbox_last_used[sandbox_id]
-                
-                for session_id, sb_id in list(self.session_sandbox_map.items()):
-                    if sb_id == sandbox_id:
-                        del self.session_sandbox_map[session_id]
+                self._forget_sandbox(sandbox_id)
             except Exception as cleanup_error:
                 logger.error(f"Error during cleanup of tracking data: {str(cleanup_error)}", exc_info=True)
             
             return {"success": False, "message": error_msg, "error": str(e)}
 
+    def _stop_and_remove(self, container) -> None:
+        """Stop and remove one sandbox container, logging rather than raising on failure"""
+        logger.debug("Processing container: ID=%s, Name=%s, Status=%s", container.id, container.name, container.status)
+        
+        self._close_shell_channel(container.id)
+        self._forget_container_handle(container.id)
+        try:
+            # Stop the container if it's running
+            if container.status == "running":
+                logger.debug("Stopping container %s", container.id)
+                container.stop(timeout=0)
+            
+            # Remove the container
+            container.remove(force=True)
+            logger.debug("Removed container %s", container.id)
+        except Exception as container_error:
+            logger.error(f"Error removing container {container.id}: {str(container_error)}", exc_info=True)
+
+    def _forget_sandbox(self, sandbox_id: str) -> None:
+        """Drop a deleted sandbox container from the tracking dicts and per-sandbox caches
+        
+        The caches are keyed by the sandbox's database ID, which is looked up from
+        the container ID, so this must run before the database record is deleted.
+        """
+        record = db.get_sandbox_by_container_id(sandbox_id)
+        with self._state_lock:
+            if record:
+                self.drop_sandbox_caches(record["id"])
+                prefix = f"{record['id']}:"
+                for status_key in [key for key in self.package_install_status if key.startswith(prefix)]:
+                    del self.package_install_status[status_key]
+            if self.sandbox_last_used.pop(sandbox_id, None) is not None:
+                logger.debug("Removed sandbox %s from tracking dict", sandbox_id)
+            # Nothing writes session mappings at the moment, so skip the scan while it is empty
+            if self.session_sandbox_map:
+                stale = [session_id for session_id, sb_id in self.session_sandbox_map.items() if sb_id == sandbox_id]
+                for session_id in stale:
+                    del self.session_sandbox_map[session_id]
+                if stale:
+                    logger.debug("Removed sandbox %s from session mapping", sandbox_id)
+
     @contextmanager
     def _get_running_sandbox(self, sandbox_id: str):
         """Get running container by sandbox_id"""
@@ -339,8 +692,40 @@ class SandboxManager:
             
             # Try to start the container
             logger.info(f"Attempting to start container for sandbox {sandbox_id}...")
+            # No reload: callers only exec by ID. The handle's status is now stale,
+            # so drop it from the cache and let the next lookup inspect again
+            self._uncache_container(sandbox_id)
             container.start()
-            container.reload()
             logger.info(f"Container for sandbox {sandbox_id} started successfully.")
         
-        yield container
+        try:
+            yield container
+        except Exception:
+            # The cached handle may be what's stale (container stopped or removed)
+            self._uncache_container(sandbox_id)
+            raise
+
+    def _retry_if_stale(self, sandbox_id: str, container, action: Callable[[], T]) -> T:
+        """Run an exec action on a container from _get_running_sandbox, retrying once if it was stopped
+        
+        The handle may be up to CONTAINER_CACHE_TTL seconds old, so "running" can be
+        stale. If the action fails with a Docker API error the cache entry is dropped
+        and the handle reloaded; a container that turns out to be stopped is started
+        and the action runs once more, anything else re-raises the original error.
+        The action should fail before doing any work when the container is down,
+        as exec creation does.
+        """
+        try:
+            return action()
+        except docker.errors.APIError as e:
+            self._uncache_container(sandbox_id)
+            try:
+                container.reload()
+            except docker.errors.NotFound:
+                raise ValueError(f"Container not found for sandbox: {sandbox_id}") from e
+            if container.status == "running":
+                raise
+            logger.info(f"Sandbox {sandbox_id} container stopped under a cached handle, restarting it")
+            self._close_shell_channel(container.id)
+            container.start()
+        return action()
@@ -1,29 +1,113 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+import json
+import re
 import threading
+import time
 from datetime import datetime
-from mcp_sandbox.utils.config import PYPI_INDEX_URL
+from itertools import islice
+from mcp_sandbox.utils.config import logger, PYPI_INDEX_URL
+from mcp_sandbox.core.sandbox_modules.manager import MAX_INSTALL_STATUSES, MAX_TRACKED_SANDBOXES
+
+# How long a sandbox's parsed package list is reused, in seconds
+PACKAGE_LIST_TTL = 30
+# Prints installed distributions in the same JSON shape as `uv pip list --format=json`,
+# without starting uv or pip
+LIST_DISTRIBUTIONS_SCRIPT = (
+    "import importlib.metadata as m, json\n"
+    "seen = {}\n"
+    "for d in m.distributions():\n"
+    "    name = d.metadata['Name']\n"
+    "    if name and name.lower() not in seen:\n"
+    "        seen[name.lower()] = {'name': name, 'version': d.version}\n"
+    "print(json.dumps(sorted(seen.values(), key=lambda p: p['name'].lower())))"
+)
+# A plain distribution name, without version specifiers, extras or URLs
+BARE_PACKAGE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
 
 class SandboxPackageMixin:
 
+    @staticmethod
+    def _public_status(status: Dict[str, Any]) -> Dict[str, Any]:
+        """Strip internal bookkeeping (keys starting with "_") from an install status"""
+        return {k: v for k, v in status.items() if not k.startswith("_")}
+
+    def _set_install_status(self, status_key: str, status: Dict[str, Any]) -> None:
+        """Store an install status, evicting the least recently updated entries past the cap
+        
+        Installs still in flight (their status holds the `_event` waiters block on)
+        are never evicted, so the table may briefly exceed the cap.
+        """
+        with self._state_lock:
+            self.package_install_status[status_key] = status
+            self.package_install_status.move_to_end(status_key)
+            excess = len(self.package_install_status) - MAX_INSTALL_STATUSES
+            if excess > 0:
+                finished = (key for key, value in self.package_install_status.items() if "_event" not in value)
+                for key in list(islice(finished, excess)):
+                    del self.package_install_status[key]
+
+    def _get_install_status(self, status_key: str):
+        """Get the current install status for a key, or None"""
+        with self._state_lock:
+            return self.package_install_status.get(status_key)
+
+    def _get_cached_packages(self, sandbox_id: str) -> Optional[list]:
+        """Return the cached package list for a sandbox if it is still fresh"""
+        with self._state_lock:
+            cached = self._pkg_cache.get(sandbox_id)
+            if cached is None:
+                return None
+            if time.monotonic() - cached[0] < PACKAGE_LIST_TTL:
+                return cached[1]
+            del self._pkg_cache[sandbox_id]
+        return None
+
+    def _cache_packages(self, sandbox_id: str, packages: list) -> None:
+        """Cache a sandbox's package list, evicting the least recently listed entries past the cap"""
+        with self._state_lock:
+            self._pkg_cache[sandbox_id] = (time.monotonic(), packages)
+            self._pkg_cache.move_to_end(sandbox_id)
+            while len(self._pkg_cache) > MAX_TRACKED_SANDBOXES:
+                self._pkg_cache.popitem(last=False)
+
+    @staticmethod
+    def _normalize_package_name(name: str) -> str:
+        return re.sub(r"[-_.]+", "-", name).lower()
+
     def _install_package_sync(self, sandbox_id: str, package_name: str) -> Dict[str, Any]:
-        from mcp_sandbox.utils.config import logger
         status_key = f"{sandbox_id}:{package_name}"
+        pending = self._get_install_status(status_key) or {}
+        done_event = pending.get("_event")
+        try:
+            return self._run_package_install(sandbox_id, package_name, status_key)
+        finally:
+            # Wake up anyone waiting on this installation, whatever the outcome
+            if done_event is not None:
+                done_event.set()
+
+    def _run_package_install(self, sandbox_id: str, package_name: str, status_key: str) -> Dict[str, Any]:
         try:
             with self._get_running_sandbox(sandbox_id) as sandbox:
                 pip_index_url = PYPI_INDEX_URL
-                pip_index_opt = f" --index-url {pip_index_url}" if pip_index_url else ""
-                print(f"Installing {package_name} with pip index URL: {pip_index_url}")
-                exec_result = sandbox.exec_run(
-                    cmd=f"uv pip install{pip_index_opt} {package_name}",
+                cmd = ["uv", "pip", "install"]
+                if pip_index_url:
+                    cmd += ["--index-url", pip_index_url]
+                # Whitespace-separated names still install several packages, as before
+                cmd += package_name.split()
+                logger.info(f"Installing {package_name} with pip index URL: {pip_index_url}")
+                exec_result = self._retry_if_stale(sandbox_id, sandbox, lambda: sandbox.exec_run(
+                    cmd=cmd,
                     stdout=True,
                     stderr=True,
                     privileged=False
-                )
+                ))
                 exit_code = exec_result.exit_code
                 output = exec_result.output.decode('utf-8')
                 logger.info(f"Package installation output: {output}")
                 logger.info(f"Exit code: {exit_code}")
                 if exit_code == 0:
+                    with self._state_lock:
+                        self._pkg_cache.pop(sandbox_id, None)
                     status = {
                         "status": "success",
                         "message": f"Successfully installed {package_name}",
@@ -31,7 +115,7 @@ class SandboxPackageMixin:
                         "success": True,
                         "end_time": datetime.now()
                     }
-                    self.package_install_status[status_key] = status
+                    self._set_install_status(status_key, status)
                     return status
                 else:
                     status = {
@@ -42,7 +126,7 @@ class SandboxPackageMixin:
                         "success": False,
                         "end_time": datetime.now()
                     }
-                    self.package_install_status[status_key] = status
+                    self._set_install_status(status_key, status)
                     return status
         except Exception as e:
             logger.error(f"Failed to install package {package_name} for sandbox {sandbox_id}: {e}", exc_info=True)
@@ -58,47 +142,69 @@ class SandboxPackageMixin:
                 "success": False,
                 "end_time": datetime.now()
             }
-            self.package_install_status[status_key] = status
+            self._set_install_status(status_key, status)
             return status
 
+    def _is_distribution_installed(self, sandbox_id: str, package_name: str) -> bool:
+        """Check the cached distribution listing for a bare package name
+        
+        No exec is made: without a fresh listing (or for requirements with
+        versions, extras or URLs) this answers False and the install goes to uv.
+        """
+        if not BARE_PACKAGE_NAME.match(package_name):
+            return False
+        cached_packages = self._get_cached_packages(sandbox_id)
+        if not cached_packages:
+            return False
+        wanted = self._normalize_package_name(package_name)
+        return any(self._normalize_package_name(pkg.get("name", "")) == wanted for pkg in cached_packages)
+
     def install_package(self, sandbox_id: str, package_name: str) -> Dict[str, Any]:
-        from mcp_sandbox.utils.config import logger
         error = self.verify_sandbox_exists(sandbox_id)
         if error:
             return error
-        logger.info(f"Starting installation of package {package_name} for sandbox {sandbox_id}")
         status_key = f"{sandbox_id}:{package_name}"
-        if status_key in self.package_install_status:
-            status = self.package_install_status[status_key]
-            if status["status"] == "installing" and not status["complete"]:
+        status = self._get_install_status(status_key)
+        # Earlier results are not reused, so a package removed since can be installed again.
+        # Pinned versions, extras and flags (e.g. --upgrade) always go through uv; for a
+        # bare name that is already installed uv would change nothing, so a fresh listing answers
+        if (status is None or status.get("complete")) and self._is_distribution_installed(sandbox_id, package_name):
+            logger.info(f"Package {package_name} is already installed in sandbox {sandbox_id}")
+            status = {
+                "status": "success",
+                "message": f"Package {package_name} is already installed",
+                "complete": True,
+                "success": True,
+                "end_time": datetime.now()
+            }
+            self._set_install_status(status_key, status)
+            return {**status, "cached": True}
+        logger.info(f"Starting installation of package {package_name} for sandbox {sandbox_id}")
+        done_event = threading.Event()
+        with self._state_lock:
+            status = self.package_install_status.get(status_key)
+            if status and status["status"] == "installing" and not status["complete"]:
                 return {
                     "success": None,
                     "status": "installing",
                     "message": f"Package {package_name} installation already in progress"
                 }
-        self.package_install_status[status_key] = {
-            "status": "installing",
-            "start_time": datetime.now(),
-            "message": f"Installing {package_name}...",
-            "complete": False
-        }
-        install_thread = threading.Thread(
-            target=self._install_package_sync,
-            args=(sandbox_id, package_name),
-            daemon=True
-        )
-        install_thread.start()
+            self._set_install_status(status_key, {
+                "status": "installing",
+                "start_time": datetime.now(),
+                # Elapsed time is measured on the monotonic clock, no datetime arithmetic
+                "_start_monotonic": time.monotonic(),
+                "message": f"Installing {package_name}...",
+                "complete": False,
+                "_event": done_event
+            })
+        self._install_pool.submit(self._install_package_sync, sandbox_id, package_name)
         try:
-            import time
-            start_time = time.time()
-            max_wait = 5
-            while time.time() - start_time < max_wait:
-                if status_key in self.package_install_status:
-                    status = self.package_install_status[status_key]
-                    if status.get("complete", False):
-                        logger.info(f"Package {package_name} installed within 5 seconds: {status}")
-                        return status
-                time.sleep(0.1)
+            if done_event.wait(timeout=5.0):
+                status = self._get_install_status(status_key)
+                if status and status.get("complete", False):
+                    logger.info(f"Package {package_name} installed within 5 seconds: {status}")
+                    return self._public_status(status)
             logger.info(f"Installation of {package_name} is taking longer than 5 seconds, continuing in background")
             return {
                 "success": None,
@@ -114,43 +220,44 @@ class SandboxPackageMixin:
             }
 
     def check_package_status(self, sandbox_id: str, package_name: str) -> Dict[str, Any]:
-        from mcp_sandbox.utils.config import logger
         error = self.verify_sandbox_exists(sandbox_id)
         if error:
             return error
         status_key = f"{sandbox_id}:{package_name}"
-        if status_key in self.package_install_status:
-            status = self.package_install_status[status_key]
-            if status.get("complete", False):
-                return status
-        if status_key in self.package_install_status and self.package_install_status[status_key]["status"] == "installing":
+        status = self._get_install_status(status_key)
+        if status and status.get("complete", False):
+            return status
+        if status and status["status"] == "installing":
             try:
-                import time
-                start_time = time.time()
-                max_wait = 5
-                while time.time() - start_time < max_wait:
-                    status = self.package_install_status[status_key]
+                done_event = status.get("_event")
+                if done_event is not None and done_event.wait(timeout=5.0):
+                    status = self._get_install_status(status_key) or status
                     if status.get("complete", False):
                         logger.info(f"Package {package_name} installation completed within check window")
                         return status
-                    time.sleep(0.1)
                 logger.info(f"Package {package_name} installation still in progress after 5 seconds")
-                elapsed_time = datetime.now() - status["start_time"]
-                status["elapsed_seconds"] = elapsed_time.total_seconds()
-                return status
+                status["elapsed_seconds"] = time.monotonic() - status["_start_monotonic"]
+                return self._public_status(status)
             except Exception as e:
                 logger.error(f"Error while waiting for package status: {e}", exc_info=True)
-        if status_key not in self.package_install_status:
+        if status is None:
+            if self._is_distribution_installed(sandbox_id, package_name):
+                return {
+                    "status": "success",
+                    "message": f"Package {package_name} is already installed",
+                    "complete": True,
+                    "success": True
+                }
             try:
                 with self._get_running_sandbox(sandbox_id) as sandbox:
-                    exec_result = sandbox.exec_run(
-                        cmd=f"uv pip list | grep -i {package_name}",
+                    # argv form: no shell, and the package name is never interpreted
+                    exec_result = self._retry_if_stale(sandbox_id, sandbox, lambda: sandbox.exec_run(
+                        cmd=["uv", "pip", "show", package_name],
                         stdout=True,
                         stderr=True,
                         privileged=False
-                    )
-                    output = exec_result.output.decode('utf-8').strip()
-                    if output and package_name.lower() in output.lower():
+                    ))
+                    if exec_result.exit_code == 0:
                         return {
                             "status": "success",
                             "message": f"Package {package_name} is already installed",
@@ -172,17 +279,15 @@ class SandboxPackageMixin:
                     "complete": True,
                     "success": False
                 }
-        status = self.package_install_status[status_key]
+        status = self._get_install_status(status_key) or status
         if status["status"] == "installing" and not status.get("complete", False):
-            elapsed_time = datetime.now() - status["start_time"]
-            status["elapsed_seconds"] = elapsed_time.total_seconds()
-        return status
+            status["elapsed_seconds"] = time.monotonic() - status["_start_monotonic"]
+        return self._public_status(status)
 
     def list_installed_packages(self, sandbox_id: str) -> list:
-        import re
-        import json
-        from mcp_sandbox.utils.config import logger
-        
+        cached_packages = self._get_cached_packages(sandbox_id)
+        if cached_packages is not None:
+            return cached_packages
         try:
             # 使用get_container_by_sandbox_id方法获取容器
             sandbox, error = self.get_container_by_sandbox_id(sandbox_id)
@@ -196,21 +301,25 @@ class SandboxPackageMixin:
                 return []
                 
             logger.info(f"[list_installed_packages] Using container for sandbox: {sandbox_id}")
-            exec_result = sandbox.exec_run('uv pip list --format=json')
+            exec_result = sandbox.exec_run(["python", "-c", LIST_DISTRIBUTIONS_SCRIPT], stderr=False)
             output = exec_result.output.decode()
-            match = re.search(r'\[.*\]', output, re.DOTALL)
-            if match:
-                json_str = match.group(0)
+            try:
+                packages = json.loads(output)
+            except ValueError:
+                # Fall back to slicing out the JSON array if anything else was printed
+                start, end = output.find('['), output.rfind(']')
+                if start == -1 or end < start:
+                    logger.warning(f"[list_installed_packages] No JSON array found in output: {output!r}")
+                    return []
+                json_str = output[start:end + 1]
                 try:
                     packages = json.loads(json_str)
-                    logger.info(f"[list_installed_packages] Successfully listed {len(packages)} packages for sandbox {sandbox_id}")
-                    return packages
-                except Exception as parse_err:
+                except ValueError as parse_err:
                     logger.error(f"[list_installed_packages] JSON parse error: {parse_err} | json_str={json_str!r}")
                     return []
-            else:
-                logger.warning(f"[list_installed_packages] No JSON array found in output: {output!r}")
-                return []
+            logger.info(f"[list_installed_packages] Successfully listed {len(packages)} packages for sandbox {sandbox_id}")
+            self._cache_packages(sandbox_id, packages)
+            return packages
         except Exception as e:
             logger.error(f"[list_installed_packages] Error listing packages in {sandbox_id}: {e}", exc_info=True)
             return []
@@ -0,0 +1,120 @@
+import atexit
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Set, Tuple
+from mcp_sandbox.utils.config import logger
+
+class WarmSandboxPool:
+    """Keep a few started sandbox containers ready to be leased
+
+    A background thread tops the pool up to `target_size` containers and
+    removes idle ones older than `ttl` seconds, so creating a sandbox only
+    has to pop a container ID instead of waiting for a cold Docker start.
+    """
+
+    def __init__(
+        self,
+        create_container: Callable[[], str],
+        remove_container: Callable[[str], None],
+        is_running: Callable[[str], bool],
+        target_size: int,
+        ttl: float = 300,
+    ):
+        self._create_container = create_container
+        self._remove_container = remove_container
+        self._is_running = is_running
+        self.target_size = target_size
+        self.ttl = ttl
+        # (monotonic creation time, container ID), oldest on the left
+        self._containers: Deque[Tuple[float, str]] = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="warm-sandbox-pool", daemon=True)
+
+    def start(self) -> None:
+        """Start filling the pool in the background"""
+        self._thread.start()
+        atexit.register(self.close)
+        logger.info(f"Warm sandbox pool started (size: {self.target_size}, ttl: {self.ttl}s)")
+
+    def lease(self) -> Optional[str]:
+        """Take a running warm container ID out of the pool, or None if none is ready"""
+        try:
+            while True:
+                now = time.monotonic()
+                container_id = None
+                with self._lock:
+                    # Oldest usable container first; expired ones are left for the reaper
+                    for index, (created, candidate) in enumerate(self._containers):
+                        if now - created < self.ttl:
+                            del self._containers[index]
+                            container_id = candidate
+                            break
+                if container_id is None or self._is_running(container_id):
+                    return container_id
+                logger.warning(f"Warm sandbox {container_id} is no longer running, discarding it")
+                self._discard(container_id)
+        finally:
+            # Refill right away rather than on the next reap tick
+            self._wakeup.set()
+
+    def container_ids(self) -> Set[str]:
+        """IDs of the containers currently waiting in the pool"""
+        with self._lock:
+            return {container_id for _, container_id in self._containers}
+
+    def close(self) -> None:
+        """Stop the refill thread and remove every container still in the pool"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        with self._lock:
+            leftovers = [container_id for _, container_id in self._containers]
+            self._containers.clear()
+        for container_id in leftovers:
+            self._discard(container_id)
+
+    def _run(self) -> None:
+        reap_interval = max(1.0, min(self.ttl / 2, 30.0))
+        while not self._stopped.is_set():
+            self._reap()
+            self._refill()
+            self._wakeup.wait(timeout=reap_interval)
+            self._wakeup.clear()
+
+    def _reap(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [container_id for created, container_id in self._containers if now - created >= self.ttl]
+            if expired:
+                self._containers = deque(item for item in self._containers if now - item[0] < self.ttl)
+        for container_id in expired:
+            logger.info(f"Removing expired warm sandbox {container_id}")
+            self._discard(container_id)
+
+    def _refill(self) -> None:
+        while not self._stopped.is_set():
+            with self._lock:
+                if len(self._containers) >= self.target_size:
+                    return
+            try:
+                container_id = self._create_container()
+            except Exception as e:
+                logger.error(f"Failed to create warm sandbox: {e}", exc_info=True)
+                # Back off instead of retrying in a tight loop
+                self._stopped.wait(timeout=5)
+                return
+            with self._lock:
+                if not self._stopped.is_set():
+                    self._containers.append((time.monotonic(), container_id))
+                    continue
+            self._discard(container_id)
+
+    def _discard(self, container_id: str) -> None:
+        try:
+            self._remove_container(container_id)
+        except Exception as e:
+            logger.warning(f"Failed to remove warm sandbox {container_id}: {e}")
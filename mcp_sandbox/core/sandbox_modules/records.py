@@ -1,21 +1,54 @@
 from typing import List, Optional, Dict, Any
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from mcp_sandbox.utils.config import logger
 
+# Upper bound on concurrent package listings when listing a user's sandboxes
+MAX_LISTING_WORKERS = 16
+
 class SandboxRecordsMixin:
     def list_sandboxes(self) -> list:
-        """Lists all sandbox containers"""
+        """Lists all sandbox containers
+        
+        Uses the low-level API so the whole listing is a single daemon call,
+        instead of one inspect (plus one image lookup) per container.
+        """
         sandboxes = []
-        for sandbox in self.sandbox_client.containers.list(all=True, filters={"label": "python-sandbox"}):
+        # Warm containers not leased yet belong to no one
+        pooled = self.warm_pool.container_ids() if self.warm_pool is not None else set()
+        for container in self.sandbox_client.api.containers(all=True, filters=self._label_filter):
+            container_id = container["Id"]
+            if container_id in pooled:
+                continue
+            names = container.get("Names") or []
+            last_used = self.sandbox_last_used.get(container_id)
+            created = container.get("Created")
             sandbox_info = {
-                "sandbox_id": sandbox.id,
-                "name": sandbox.name,
-                "status": sandbox.status,
-                "image": sandbox.image.tags[0] if sandbox.image.tags else sandbox.image.short_id,
-                "created": sandbox.attrs["Created"],
-                "last_used": self.sandbox_last_used.get(sandbox.id),
+                "sandbox_id": container_id,
+                "name": names[0].lstrip("/") if names else container_id[:12],
+                "status": container.get("State"),
+                "image": self._image_label(container),
+                # Same RFC 3339 form as the inspect payload's "Created", to whole seconds
+                "created": (
+                    datetime.fromtimestamp(created, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                    if created is not None else None
+                ),
+                "last_used": datetime.fromtimestamp(last_used) if last_used is not None else None,
             }
             sandboxes.append(sandbox_info)
         return sandboxes
+
+    @staticmethod
+    def _image_label(container: Dict[str, Any]) -> Optional[str]:
+        """Image tag of a container listing entry, or the image's short ID if it has none
+        
+        The daemon reports the image ID instead of the tag once the tag no longer
+        points at the container's image; that is shortened like Image.short_id.
+        """
+        image = container.get("Image")
+        if image and image.startswith("sha256:"):
+            return (container.get("ImageID") or image)[:17]
+        return image
         
     def list_user_sandboxes(self, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """Lists all sandboxes belonging to a user with additional information
@@ -46,27 +79,26 @@ class SandboxRecordsMixin:
         
         # Return directly from database if available
         if user_sandboxes:
-            # Filter results, only return sandbox_id, name and installed_packages
-            filtered_sandboxes = []
+            # Each package listing is an exec in a different container, so run them concurrently
+            with ThreadPoolExecutor(max_workers=min(MAX_LISTING_WORKERS, len(user_sandboxes))) as executor:
+                package_lists = list(executor.map(self._list_packages_safe, [sandbox["id"] for sandbox in user_sandboxes]))
             
-            for sandbox in user_sandboxes:
-                # Create a new simplified sandbox record
-                filtered_sandbox = {
+            # Filter results, only return sandbox_id, name and installed_packages
+            return [
+                {
                     "sandbox_id": sandbox["id"],
                     "name": sandbox["name"],
-                    "installed_packages": []
+                    "installed_packages": packages or []
                 }
-                
-                # Get installed packages
-                try:
-                    packages = self.list_installed_packages(sandbox["id"])
-                    if packages:
-                        filtered_sandbox["installed_packages"] = packages
-                except Exception as e:
-                    logger.error(f"Error listing packages for sandbox {sandbox['id']}: {e}")
-                    
-                filtered_sandboxes.append(filtered_sandbox)
-            
-            return filtered_sandboxes
+                for sandbox, packages in zip(user_sandboxes, package_lists)
+            ]
         
         return []
+
+    def _list_packages_safe(self, sandbox_id: str) -> list:
+        """list_installed_packages that logs and returns [] instead of raising"""
+        try:
+            return self.list_installed_packages(sandbox_id)
+        except Exception as e:
+            logger.error(f"Error listing packages for sandbox {sandbox_id}: {e}")
+            return []
@@ -0,0 +1,172 @@
+import re
+import secrets
+import shlex
+import socket
+import threading
+from typing import Tuple
+from docker.utils.socket import STDERR, STDOUT, frames_iter
+
+# Commands that start background jobs or detach from the shell would keep writing to
+# the channel's stdout/stderr after their markers, so they get an exec of their own.
+# A stray match (e.g. a quoted "&") only costs the faster path.
+_DETACHING_COMMAND = re.compile(r"(?<![&<>])&(?![&>])|\b(?:nohup|setsid|disown)\b")
+
+# Runs "$1" with its stdio on temp files and replays them once it exits, so jobs it
+# leaves in the background hold the files rather than the exec's output stream
+DETACHED_COMMAND_WRAPPER = (
+    'out=$(mktemp); err=$(mktemp)\n'
+    '/bin/sh -c "$1" >"$out" 2>"$err" </dev/null; code=$?\n'
+    'cat "$out"; cat "$err" >&2; rm -f "$out" "$err"; exit $code\n'
+)
+
+def timeout_note(timeout: float) -> str:
+    """Text appended to stderr when a command is abandoned after `timeout` seconds"""
+    return f"\n[command timed out after {timeout} seconds]"
+
+class ShellChannelClosed(Exception):
+    """The shell behind a ShellChannel exited or its socket was closed"""
+
+class ShellChannelBusy(Exception):
+    """Another command is currently running on the ShellChannel"""
+
+class ShellChannel:
+    """A long-lived /bin/sh exec inside one container, reused for terminal commands
+
+    Each command runs in its own `sh -c` with stdin from /dev/null, so it
+    cannot change the channel's working directory or environment, read the
+    channel's own input, or leave the channel waiting on a half-parsed line.
+    Per-channel nonce markers written to both stdout and stderr before and
+    after the command tell us where its output starts and ends and what its
+    exit code was; anything outside them is dropped.
+    """
+
+    def __init__(self, api, container_id: str, workdir: str = "/app/results"):
+        exec_id = api.exec_create(
+            container_id, ["/bin/sh"], stdin=True, stdout=True, stderr=True, tty=False, workdir=workdir
+        )["Id"]
+        self._sock = api.exec_start(exec_id, socket=True)
+        # SocketIO wraps the real socket for unix transports; TLS hands back the socket itself
+        self._raw = getattr(self._sock, "_sock", self._sock)
+        self._raw.settimeout(None)
+        self._frames = frames_iter(self._sock, tty=False)
+        self._marker = f"__MCP_SANDBOX_{secrets.token_hex(8)}__".encode()
+        self._lock = threading.Lock()
+        self._timed_out = False
+        self.closed = False
+
+    @staticmethod
+    def can_run(command: str) -> bool:
+        """Whether a command is safe to run on a shared channel rather than its own exec"""
+        return not _DETACHING_COMMAND.search(command)
+
+    def run(self, command: str, max_output_bytes: int, timeout: float) -> Tuple[int, bytes, bytes]:
+        """Run a command through the shell and wait for it to finish
+
+        Raises ShellChannelBusy if another command holds the channel, and
+        ShellChannelClosed if the command could not be sent; in both cases it
+        did not run and can be run elsewhere. If the shell exits mid-command,
+        the output exceeds `max_output_bytes` or the command is still running
+        after `timeout` seconds, the channel is closed and the output read so
+        far is returned with exit code -1.
+
+        Returns:
+            Tuple of (exit_code, stdout_bytes, stderr_bytes)
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ShellChannelBusy("Shell channel is busy")
+        try:
+            if self.closed:
+                raise ShellChannelClosed("Shell channel is closed")
+            marker = self._marker.decode()
+            script = (
+                f"printf '{marker}BEGIN\\n'; printf '{marker}BEGIN\\n' >&2\n"
+                f"/bin/sh -c {shlex.quote(command)} </dev/null\n"
+                f"printf '\\n{marker}END %d\\n' $?\n"
+                f"printf '\\n{marker}END\\n' >&2\n"
+            )
+            try:
+                self._raw.sendall(script.encode())
+            except OSError as e:
+                self.close()
+                raise ShellChannelClosed(str(e)) from e
+
+            # Shutting the socket down wakes the blocked frame reader below
+            timer = threading.Timer(timeout, self._expire)
+            timer.daemon = True
+            timer.start()
+            try:
+                exit_code, out, err = self._read_result(max_output_bytes)
+            finally:
+                timer.cancel()
+            if self._timed_out:
+                self.close()
+                err += timeout_note(timeout).encode()
+                return -1, out, err
+            return exit_code, out, err
+        finally:
+            self._lock.release()
+
+    def _read_result(self, max_output_bytes: int) -> Tuple[int, bytes, bytes]:
+        """Read frames until both end markers arrived, the shell exits or the cap is hit"""
+        begin = self._marker + b"BEGIN\n"
+        stdout_end = b"\n" + self._marker + b"END "
+        stderr_end = b"\n" + self._marker + b"END\n"
+        buffers = {STDOUT: bytearray(), STDERR: bytearray()}
+        # Output before the begin markers is left over from earlier commands
+        started = {STDOUT: False, STDERR: False}
+        exit_code = None
+        stderr_done = False
+        while exit_code is None or not stderr_done:
+            try:
+                stream, data = next(self._frames)
+            except (StopIteration, OSError):
+                # The command already ran (at least partly), so report rather than retry
+                self.close()
+                return -1, bytes(buffers[STDOUT]), bytes(buffers[STDERR])
+            buf = buffers.get(stream)
+            # Output after a stream's end marker is stray output, not part of the result
+            if buf is None or (exit_code is not None if stream == STDOUT else stderr_done):
+                continue
+            buf.extend(data)
+            if not started[stream]:
+                pos = buf.find(begin)
+                if pos == -1:
+                    # Keep just enough to recognise a marker split across frames
+                    del buf[:-len(begin)]
+                    continue
+                del buf[:pos + len(begin)]
+                started[stream] = True
+            if stream == STDOUT and exit_code is None:
+                pos = buf.find(stdout_end)
+                line_end = buf.find(b"\n", pos + len(stdout_end)) if pos != -1 else -1
+                if line_end != -1:
+                    # Only the marker line is parsed; anything after it is stray output
+                    try:
+                        exit_code = int(buf[pos + len(stdout_end):line_end])
+                    except ValueError:
+                        exit_code = -1
+                    del buf[pos:]
+            elif stream == STDERR and not stderr_done:
+                pos = buf.find(stderr_end)
+                if pos != -1:
+                    stderr_done = True
+                    del buf[pos:]
+            if len(buffers[STDOUT]) + len(buffers[STDERR]) > max_output_bytes:
+                self.close()
+                return -1, bytes(buffers[STDOUT]), bytes(buffers[STDERR])
+        return exit_code, bytes(buffers[STDOUT]), bytes(buffers[STDERR])
+
+    def _expire(self) -> None:
+        self._timed_out = True
+        try:
+            self._raw.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        self.closed = True
+        for sock in (self._sock, self._raw):
+            try:
+                sock.close()
+            except Exception:
+                pass
@@ -1,9 +1,38 @@
 import os
 import sqlite3
-from typing import Dict, List, Optional
-import uuid
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import secrets
 from datetime import datetime
 
+# Statements are fixed strings so the connection's statement cache always hits
+SQL_GET_USER_BY_USERNAME = "SELECT * FROM users WHERE LOWER(username) = ?"
+SQL_GET_USER_BY_EMAIL = "SELECT * FROM users WHERE LOWER(email) = ?"
+SQL_GET_USER_BY_ID = "SELECT * FROM users WHERE id = ?"
+SQL_GET_USER_BY_API_KEY = "SELECT * FROM users WHERE api_key = ?"
+SQL_GET_ALL_USERS = "SELECT * FROM users"
+SQL_INSERT_USER = (
+    "INSERT INTO users (id, username, email, hashed_password, created_at, is_active, api_key) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+USER_UPDATE_COLUMNS = ("username", "email", "hashed_password", "is_active", "api_key")
+
+
+@lru_cache(maxsize=None)
+def _update_user_sql(columns: Tuple[str, ...]) -> str:
+    """UPDATE statement for a set of USER_UPDATE_COLUMNS, one fixed string per combination"""
+    return f"UPDATE users SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?"
+
+# Names unnamed sandboxes "Sandbox <n>" in the same statement as the insert, so it is atomic
+SQL_INSERT_SANDBOX = (
+    "INSERT INTO sandboxes (id, user_id, name, created_at, docker_container_id) "
+    "SELECT ?, ?, COALESCE(?, 'Sandbox ' || (SELECT COUNT(*) + 1 FROM sandboxes WHERE user_id = ?)), ?, ?"
+)
+SQL_GET_SANDBOX = "SELECT * FROM sandboxes WHERE id = ?"
+SQL_GET_SANDBOX_BY_CONTAINER = "SELECT * FROM sandboxes WHERE docker_container_id = ?"
+SQL_GET_USER_SANDBOXES = "SELECT * FROM sandboxes WHERE user_id = ?"
+SQL_DELETE_SANDBOX = "DELETE FROM sandboxes WHERE id = ?"
 
 
 class Database:
@@ -11,12 +40,20 @@ class Database:
     def __init__(self, db_path: str = None):
         if db_path is None:
             db_path = os.path.join(os.path.dirname(__file__), "sandbox.db")
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=256)
         self.conn.row_factory = sqlite3.Row
+        # The connection is shared by the event loop's worker threads, install workers and
+        # listing pools; statements and commits are serialized so transactions can't interleave
+        self._lock = threading.Lock()
         self._initialize_db()
 
     def _initialize_db(self):
         cur = self.conn.cursor()
+        # WAL lets readers proceed during writes; NORMAL sync is durable enough for WAL
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute("PRAGMA mmap_size=268435456")
         # Users table
         cur.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -40,36 +77,53 @@ class Database:
                 FOREIGN KEY(user_id) REFERENCES users(id)
             )
         ''')
+        # Case-insensitive username/email lookups in get_user match these expressions
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users(LOWER(username))")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_email_lower ON users(LOWER(email))")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_api_key ON users(api_key)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_sandboxes_user_id ON sandboxes(user_id)")
         self.conn.commit()
-    
+
+    def _fetchone(self, sql: str, params: tuple) -> Optional[Dict]:
+        """Run a query under the connection lock and return its first row as a dict"""
+        with self._lock:
+            row = self.conn.execute(sql, params).fetchone()
+        return dict(row) if row else None
+
+    def _fetchall(self, sql: str, params: tuple = ()) -> List[Dict]:
+        """Run a query under the connection lock and return all rows as dicts"""
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def _write(self, sql: str, params: tuple) -> int:
+        """Run a statement and commit it under the connection lock, returning the row count"""
+        with self._lock:
+            cur = self.conn.execute(sql, params)
+            self.conn.commit()
+            return cur.rowcount
+
     def get_user(self, username: str = None, email: str = None, user_id: str = None) -> Optional[Dict]:
         """Get user by username, email or ID"""
         try:
-            cur = self.conn.cursor()
             if username:
-                cur.execute("SELECT * FROM users WHERE LOWER(username) = ?", (username.lower(),))
+                return self._fetchone(SQL_GET_USER_BY_USERNAME, (username.lower(),))
             elif email:
-                cur.execute("SELECT * FROM users WHERE LOWER(email) = ?", (email.lower(),))
+                return self._fetchone(SQL_GET_USER_BY_EMAIL, (email.lower(),))
             elif user_id:
-                cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+                return self._fetchone(SQL_GET_USER_BY_ID, (user_id,))
             else:
                 return None
-            row = cur.fetchone()
-            return dict(row) if row else None
         except Exception as e:
             print(f"Error retrieving user: {e}")
             return None
     
     def create_user(self, user_data: Dict) -> Dict:
         """Create a new user"""
-        user_id = str(uuid.uuid4())
+        user_id = secrets.token_hex(16)
         created_at = datetime.now().isoformat()
         is_active = 1
-        cur = self.conn.cursor()
-        cur.execute('''
-            INSERT INTO users (id, username, email, hashed_password, created_at, is_active, api_key)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        self._write(SQL_INSERT_USER, (
             user_id,
             user_data.get("username"),
             user_data.get("email"),
@@ -78,7 +132,6 @@ class Database:
             is_active,
             user_data.get("api_key")
         ))
-        self.conn.commit()
         return {
             "id": user_id,
             "username": user_data.get("username"),
@@ -90,25 +143,19 @@ class Database:
         }
     
     def update_user(self, user_id: str, user_data: Dict) -> Optional[Dict]:
-        """Update a user"""
-        cur = self.conn.cursor()
-        fields = []
-        values = []
-        for k, v in user_data.items():
-            fields.append(f"{k} = ?")
-            values.append(v)
-        values.append(user_id)
-        sql = f"UPDATE users SET {', '.join(fields)} WHERE id = ?"
-        cur.execute(sql, tuple(values))
-        self.conn.commit()
+        """Update a user
+        
+        Only the columns in USER_UPDATE_COLUMNS are written, including explicit
+        None values (e.g. to revoke an API key); other keys are ignored.
+        """
+        columns = tuple(column for column in USER_UPDATE_COLUMNS if column in user_data)
+        if columns:
+            self._write(_update_user_sql(columns), (*(user_data[column] for column in columns), user_id))
         return self.get_user(user_id=user_id)
     
     def get_all_users(self) -> List[Dict]:
         """Get all users"""
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM users")
-        rows = cur.fetchall()
-        return [dict(row) for row in rows]
+        return self._fetchall(SQL_GET_ALL_USERS)
     
     def get_user_by_api_key(self, api_key: str) -> Optional[Dict]:
         """Get user by API key
@@ -120,52 +167,40 @@ class Database:
             User dict if API key is valid, None otherwise
         """
         try:
-            cur = self.conn.cursor()
-            cur.execute("SELECT * FROM users WHERE api_key = ?", (api_key,))
-            row = cur.fetchone()
-            return dict(row) if row else None
+            return self._fetchone(SQL_GET_USER_BY_API_KEY, (api_key,))
         except Exception as e:
             print(f"Error retrieving user by API key: {e}")
             return None
     
     def create_sandbox(self, user_id: str, name: str = None, docker_container_id: str = None) -> str:
         """Create a new sandbox for a user"""
-        sandbox_id = str(uuid.uuid4())
+        sandbox_id = secrets.token_hex(16)
         created_at = datetime.now().isoformat()
-        if name is None:
-            # Count user's sandboxes
-            cur = self.conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM sandboxes WHERE user_id = ?", (user_id,))
-            count = cur.fetchone()[0]
-            name = f"Sandbox {count + 1}"
-        cur = self.conn.cursor()
-        cur.execute('''
-            INSERT INTO sandboxes (id, user_id, name, created_at, docker_container_id)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            sandbox_id, user_id, name, created_at, docker_container_id
+        self._write(SQL_INSERT_SANDBOX, (
+            sandbox_id, user_id, name, user_id, created_at, docker_container_id
         ))
-        self.conn.commit()
         return sandbox_id
     
     def get_sandbox(self, sandbox_id: str) -> Optional[Dict]:
         """Get sandbox by ID"""
         try:
-            cur = self.conn.cursor()
-            cur.execute("SELECT * FROM sandboxes WHERE id = ?", (sandbox_id,))
-            row = cur.fetchone()
-            return dict(row) if row else None
+            return self._fetchone(SQL_GET_SANDBOX, (sandbox_id,))
         except Exception as e:
             print(f"Error retrieving sandbox: {e}")
             return None
     
+    def get_sandbox_by_container_id(self, docker_container_id: str) -> Optional[Dict]:
+        """Get the sandbox record linked to a Docker container ID"""
+        try:
+            return self._fetchone(SQL_GET_SANDBOX_BY_CONTAINER, (docker_container_id,))
+        except Exception as e:
+            print(f"Error retrieving sandbox by container ID: {e}")
+            return None
+    
     def get_user_sandboxes(self, user_id: str) -> List[Dict]:
         """Get all sandboxes for a user"""
         try:
-            cur = self.conn.cursor()
-            cur.execute("SELECT * FROM sandboxes WHERE user_id = ?", (user_id,))
-            rows = cur.fetchall()
-            return [dict(row) for row in rows]
+            return self._fetchall(SQL_GET_USER_SANDBOXES, (user_id,))
         except Exception as e:
             print(f"Error retrieving user sandboxes: {e}")
             return []
@@ -180,10 +215,7 @@ class Database:
     def delete_sandbox(self, sandbox_id: str) -> bool:
         """Delete a sandbox by ID"""
         try:
-            cur = self.conn.cursor()
-            cur.execute("DELETE FROM sandboxes WHERE id = ?", (sandbox_id,))
-            self.conn.commit()
-            return cur.rowcount > 0
+            return self._write(SQL_DELETE_SANDBOX, (sandbox_id,)) > 0
         except Exception as e:
             print(f"Error deleting sandbox: {e}")
             return False
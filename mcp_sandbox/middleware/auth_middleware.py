@@ -5,25 +5,41 @@ It supports multiple authentication methods (bearer token and API key) and handl
 for public routes like login, register, static files, and documentation.
 """
 
+import asyncio
+import hashlib
 import re
-from typing import List, Optional
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Tuple
 from fastapi import Request, status
 from fastapi.responses import JSONResponse
 from jose import JWTError, jwt
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from mcp_sandbox.utils.config import REQUIRE_AUTH, DEFAULT_USER_ID, logger
 from mcp_sandbox.auth.utils import SECRET_KEY, ALGORITHM
 from mcp_sandbox.db.database import db
 
+# Seconds a validated token or API key is trusted without decoding or querying again;
+# also bounds how long a revoked key or deactivated user keeps working
+AUTH_CACHE_TTL = 5
+AUTH_CACHE_SIZE = 10_000
+# Distinct request paths whose public/protected decision is remembered
+PUBLIC_PATH_CACHE_SIZE = 4096
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    """Authentication middleware that enforces auth for protected routes"""
+
+class AuthMiddleware:
+    """Authentication middleware that enforces auth for protected routes
+    
+    A plain ASGI middleware rather than a BaseHTTPMiddleware, so requests and
+    responses (including SSE streams) pass through without an extra task and
+    memory streams per request.
+    """
     
     def __init__(
         self, 
-        app,
+        app: ASGIApp,
         public_paths: List[str] = None,
         public_path_regexes: List[str] = None
     ):
@@ -34,7 +50,7 @@ class AuthMiddleware(BaseHTTPMiddleware):
             public_paths: List of path prefixes that are exempt from authentication
             public_path_regexes: List of regex patterns for paths exempt from authentication
         """
-        super().__init__(app)
+        self.app = app
         self.public_paths = public_paths or [
             "/api/register",
             "/api/token",
@@ -53,24 +69,41 @@ class AuthMiddleware(BaseHTTPMiddleware):
             r"^/js/.*",
             r"^/img/.*",
         ]
-        self.compiled_regexes = [re.compile(pattern) for pattern in self.public_path_regexes]
+        # One alternation per kind, so a path is checked with two C-level matches;
+        # "(?!)" never matches and keeps an empty list from making everything public
+        self._public_prefix_re = re.compile(
+            "|".join(re.escape(public_path) for public_path in self.public_paths) or "(?!)"
+        )
+        self._public_path_re = re.compile(
+            "|".join(f"(?:{pattern})" for pattern in self.public_path_regexes) or "(?!)"
+        )
+        # Per-instance memo of path decisions; bounded because paths are client-controlled
+        self._is_public_path = lru_cache(maxsize=PUBLIC_PATH_CACHE_SIZE)(self._match_public_path)
+        # credential digest -> (monotonic expiry, user). Only touched from the event
+        # loop thread (database lookups run in worker threads), so it needs no lock
+        self._auth_cache: OrderedDict[bytes, Tuple[float, dict]] = OrderedDict()
         logger.info(f"Auth middleware initialized with requireAuth={REQUIRE_AUTH}")
     
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Process each request through the middleware
         
         Args:
-            request: The incoming request
-            call_next: Function to call the next middleware or route handler
-            
-        Returns:
-            The response from the route handler or an error response
+            scope: The ASGI connection scope
+            receive: ASGI receive channel
+            send: ASGI send channel
         """
+        # Lifespan and websocket traffic is passed through untouched
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Only reads the scope; the body is left for the route handler
+        request = Request(scope)
+        
         # Always allow OPTIONS requests for CORS
         if request.method == "OPTIONS":
-            return await call_next(request)
+            await self.app(scope, receive, send)
+            return
             
         # Short-circuit if authentication is disabled in config
         if not REQUIRE_AUTH:
@@ -80,49 +113,42 @@ class AuthMiddleware(BaseHTTPMiddleware):
                 "username": "root",
                 "is_active": True
             }
-            return await call_next(request)
+            await self.app(scope, receive, send)
+            return
             
-        # Check if this is a public path that doesn't require authentication
-        path = request.url.path
-        
         # Skip auth for public paths
-        if self._is_public_path(path):
-            return await call_next(request)
+        if self._is_public_path(scope["path"]):
+            await self.app(scope, receive, send)
+            return
             
         # Authenticate the request
         user = await self._authenticate_request(request)
         if user:
-            # Store authenticated user in request state for route handlers
+            # Store authenticated user in request state (scope["state"]) for route handlers
             request.state.user = user
-            return await call_next(request)
+            await self.app(scope, receive, send)
+            return
         
         # Return 401 Unauthorized if authentication failed
-        return JSONResponse(
+        response = JSONResponse(
             status_code=status.HTTP_401_UNAUTHORIZED,
             content={"detail": "Authentication required"},
             headers={"WWW-Authenticate": "Bearer"},
         )
+        await response(scope, receive, send)
     
-    def _is_public_path(self, path: str) -> bool:
+    def _match_public_path(self, path: str) -> bool:
         """Check if a path is public and doesn't require authentication
         
+        Called through the memoized `self._is_public_path`.
+        
         Args:
             path: URL path to check
             
         Returns:
             True if path is public, False otherwise
         """
-        # Check fixed public paths
-        for public_path in self.public_paths:
-            if path.startswith(public_path):
-                return True
-                
-        # Check regex patterns
-        for pattern in self.compiled_regexes:
-            if pattern.match(path):
-                return True
-                
-        return False
+        return bool(self._public_prefix_re.match(path) or self._public_path_re.match(path))
     
     async def _authenticate_request(self, request: Request) -> Optional[dict]:
         """Authenticate a request using various methods
@@ -138,8 +164,18 @@ class AuthMiddleware(BaseHTTPMiddleware):
         Returns:
             User dict if authenticated, None otherwise
         """
+        # One pass over the raw ASGI headers (names are lowercase bytes), keeping
+        # the first value of each like Headers.get would
+        authorization = api_key = None
+        for name, value in request.scope["headers"]:
+            if name == b"authorization":
+                if authorization is None:
+                    authorization = value.decode("latin-1")
+            elif name == b"x-api-key":
+                if api_key is None:
+                    api_key = value.decode("latin-1")
+        
         # Try to get token from Authorization header
-        authorization = request.headers.get("Authorization")
         if authorization and authorization.startswith("Bearer "):
             token = authorization.replace("Bearer ", "")
             user = await self._authenticate_jwt(token)
@@ -147,16 +183,15 @@ class AuthMiddleware(BaseHTTPMiddleware):
                 return user
         
         # Try to get API key from header
-        api_key = request.headers.get("X-API-Key")
         if api_key:
-            user = self._authenticate_api_key(api_key)
+            user = await self._authenticate_api_key(api_key)
             if user:
                 return user
         
-        # Try to get API key from query params
+        # Try to get API key from query params (only parsed when the headers had nothing valid)
         api_key_param = request.query_params.get("api_key")
         if api_key_param:
-            user = self._authenticate_api_key(api_key_param)
+            user = await self._authenticate_api_key(api_key_param)
             if user:
                 return user
         
@@ -172,22 +207,31 @@ class AuthMiddleware(BaseHTTPMiddleware):
         Returns:
             User dict if token is valid, None otherwise
         """
+        cache_key = self._credential_key(b"jwt", token)
+        user = self._get_cached_user(cache_key)
+        if user:
+            return user
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
             username = payload.get("sub")
             if not username:
                 return None
                 
-            # Get user from database
-            user = db.get_user(username=username)
+            # Get user from database, off the event loop
+            user = await asyncio.to_thread(db.get_user, username=username)
             if not user or not user.get("is_active"):
                 return None
-                
+            
+            # Never trust the cached result past the token's own expiry
+            ttl = AUTH_CACHE_TTL
+            if isinstance(payload.get("exp"), (int, float)):
+                ttl = min(ttl, payload["exp"] - time.time())
+            self._cache_user(cache_key, user, ttl)
             return user
         except JWTError:
             return None
     
-    def _authenticate_api_key(self, api_key: str) -> Optional[dict]:
+    async def _authenticate_api_key(self, api_key: str) -> Optional[dict]:
         """Authenticate using API key
         
         Args:
@@ -196,8 +240,38 @@ class AuthMiddleware(BaseHTTPMiddleware):
         Returns:
             User dict if API key is valid, None otherwise
         """
-        user = db.get_user_by_api_key(api_key)
+        cache_key = self._credential_key(b"key", api_key)
+        user = self._get_cached_user(cache_key)
+        if user:
+            return user
+        user = await asyncio.to_thread(db.get_user_by_api_key, api_key)
         if user and user.get("is_active", True):
+            self._cache_user(cache_key, user, AUTH_CACHE_TTL)
             return user
         
         return None
+    
+    @staticmethod
+    def _credential_key(kind: bytes, credential: str) -> bytes:
+        """Cache key for a credential; the raw token or key is never kept in memory"""
+        return kind + hashlib.blake2b(credential.encode(), digest_size=16).digest()
+    
+    def _get_cached_user(self, cache_key: bytes) -> Optional[dict]:
+        """Return the user cached for a credential if the entry has not expired"""
+        entry = self._auth_cache.get(cache_key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._auth_cache[cache_key]
+            return None
+        self._auth_cache.move_to_end(cache_key)
+        return entry[1]
+    
+    def _cache_user(self, cache_key: bytes, user: dict, ttl: float) -> None:
+        """Remember an authenticated user for `ttl` seconds, evicting the oldest entries past the cap"""
+        if ttl <= 0:
+            return
+        self._auth_cache[cache_key] = (time.monotonic() + ttl, user)
+        self._auth_cache.move_to_end(cache_key)
+        while len(self._auth_cache) > AUTH_CACHE_SIZE:
+            self._auth_cache.popitem(last=False)
@@ -1,5 +1,8 @@
+import atexit
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 import tomli
 from pathlib import Path
 
@@ -22,6 +25,12 @@ DEFAULT_CONFIG = {
         "dockerfile_path": "sandbox_images/Dockerfile",
         "check_dockerfile_changes": True,
         "build_info_file": ".docker_build_info",
+        "install_workers": 4,
+        "warm_pool_size": 0,
+        "warm_pool_ttl": 300,
+        "max_output_bytes": 10 << 20,
+        "command_timeout": 300,
+        "api_pool_size": 32,
     },
     "logging": {
         "level": "INFO",
@@ -43,6 +52,12 @@ except (FileNotFoundError, tomli.TOMLDecodeError) as e:
 HOST = os.environ.get("APP_HOST", config["server"]["host"])
 PORT = int(os.environ.get("APP_PORT", config["server"]["port"]))
 DEFAULT_DOCKER_IMAGE = config["docker"]["default_image"]
+INSTALL_WORKERS = config["docker"].get("install_workers", 4)
+WARM_POOL_SIZE = int(os.environ.get("SANDBOX_POOL_SIZE", config["docker"].get("warm_pool_size", 0)))
+WARM_POOL_TTL = config["docker"].get("warm_pool_ttl", 300)
+MAX_OUTPUT_BYTES = config["docker"].get("max_output_bytes", 10 << 20)
+COMMAND_TIMEOUT = config["docker"].get("command_timeout", 300)
+DOCKER_API_POOL_SIZE = config["docker"].get("api_pool_size", 32)
 
 # Auth configuration
 REQUIRE_AUTH = config.get("auth", {}).get("require_auth", False)
@@ -76,12 +91,19 @@ class ColorFormatter(logging.Formatter):
         color = self.COLOR_MAP.get(record.levelno, self.RESET_SEQ)
         return f"{color}{msg}{self.RESET_SEQ}"
 
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(ColorFormatter(config["logging"]["format"]))
-# File handler
-file_handler = logging.FileHandler(config["logging"]["log_file"])
-file_handler.setFormatter(formatter)
-# Attach handlers
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
\ No newline at end of file
+# Attach handlers only once: the logger is process-global, so re-executing this
+# module (a reload, or an import under a second name) must not double every write
+if not logger.handlers:
+    # Console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(ColorFormatter(config["logging"]["format"]))
+    # File handler
+    file_handler = logging.FileHandler(config["logging"]["log_file"])
+    file_handler.setFormatter(formatter)
+    # Callers only enqueue records; a listener thread does the console and file
+    # writes, so request handlers and the event loop never block on log I/O
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    logger.addHandler(QueueHandler(log_queue))
@@ -1,26 +1,34 @@
-import time
 import threading
 from mcp_sandbox.utils.config import logger
 
 class PeriodicTaskManager:
     """Manager for periodic background tasks"""
-    
+
     @staticmethod
-    def start_task(task_func, interval_seconds: int, task_name: str) -> None:
-        """Start a background periodic task"""
+    def start_task(task_func, interval_seconds: int, task_name: str) -> threading.Event:
+        """Start a background periodic task
+
+        Returns:
+            Event that stops the task when set
+        """
+        stop_event = threading.Event()
+
         def periodic_runner():
-            while True:
+            while not stop_event.is_set():
                 try:
                     task_func()
-                    time.sleep(interval_seconds)
                 except Exception as e:
-                    logger.error(f"{task_name} task error: {e}")
-        
-        task_thread = threading.Thread(target=periodic_runner, daemon=True)
+                    logger.error(f"{task_name} task error: {e}", exc_info=True)
+                # Wait after failures too, instead of retrying in a tight loop,
+                # and wake up as soon as the task is stopped
+                stop_event.wait(interval_seconds)
+
+        task_thread = threading.Thread(target=periodic_runner, name=task_name, daemon=True)
         task_thread.start()
         logger.info(f"Started {task_name} task")
+        return stop_event
 
     @staticmethod
-    def start_file_cleanup(cleanup_func) -> None:
+    def start_file_cleanup(cleanup_func) -> threading.Event:
         """Start background task for periodic file cleanup"""
-        PeriodicTaskManager.start_task(cleanup_func, 600, "automatic file cleanup") 
\ No newline at end of file
+        return PeriodicTaskManager.start_task(cleanup_func, 600, "automatic file cleanup")
@@ -0,0 +1,164 @@
+import socket
+import struct
+
+import pytest
+
+from mcp_sandbox.core.sandbox_modules.shell import (
+    ShellChannel, ShellChannelBusy, ShellChannelClosed, timeout_note
+)
+
+STDOUT = 1
+STDERR = 2
+
+
+class FakeAPI:
+    """Stands in for the Docker API, handing ShellChannel one end of a socketpair"""
+
+    def __init__(self):
+        self.client_sock, self.daemon_sock = socket.socketpair()
+
+    def exec_create(self, container_id, cmd, **kwargs):
+        return {"Id": "exec-id"}
+
+    def exec_start(self, exec_id, socket=False):
+        return self.client_sock
+
+
+def frame(stream: int, data: bytes) -> bytes:
+    """Encode data the way the daemon multiplexes a non-tty exec's output"""
+    return struct.pack(">BxxxL", stream, len(data)) + data
+
+
+@pytest.fixture
+def channel():
+    api = FakeAPI()
+    channel = ShellChannel(api, "container-id")
+    channel.daemon = api.daemon_sock
+    yield channel
+    channel.close()
+    api.daemon_sock.close()
+
+
+def send(channel, *frames) -> None:
+    channel.daemon.sendall(b"".join(frames))
+
+
+def begin(channel) -> bytes:
+    return channel._marker + b"BEGIN\n"
+
+
+def stdout_end(channel, exit_code) -> bytes:
+    return b"\n" + channel._marker + f"END {exit_code}\n".encode()
+
+
+def stderr_end(channel) -> bytes:
+    return b"\n" + channel._marker + b"END\n"
+
+
+def test_output_between_markers(channel):
+    send(
+        channel,
+        frame(STDOUT, begin(channel) + b"hello\n"),
+        frame(STDERR, begin(channel) + b"warning\n"),
+        frame(STDOUT, stdout_end(channel, 0)),
+        frame(STDERR, stderr_end(channel)),
+    )
+    assert channel.run("echo hello", 1024, 5) == (0, b"hello\n", b"warning\n")
+
+
+def test_output_outside_markers_is_dropped(channel):
+    send(
+        channel,
+        frame(STDOUT, b"left over from an earlier command\n" + begin(channel) + b"result"),
+        frame(STDERR, b"stale\n" + begin(channel)),
+        frame(STDOUT, stdout_end(channel, 0) + b"background job\n"),
+        frame(STDERR, stderr_end(channel) + b"late\n"),
+    )
+    assert channel.run("true", 1024, 5) == (0, b"result", b"")
+
+
+def test_markers_split_across_frames(channel):
+    head, tail = begin(channel)[:10], begin(channel)[10:]
+    end = stdout_end(channel, 0)
+    send(
+        channel,
+        frame(STDOUT, head),
+        frame(STDOUT, tail + b"out"),
+        frame(STDOUT, end[:7]),
+        frame(STDOUT, end[7:]),
+        frame(STDERR, begin(channel) + stderr_end(channel)),
+    )
+    assert channel.run("true", 1024, 5) == (0, b"out", b"")
+
+
+@pytest.mark.parametrize("exit_code, expected", [(0, 0), (1, 1), (127, 127), ("x", -1)])
+def test_exit_code_from_marker_line(channel, exit_code, expected):
+    send(
+        channel,
+        frame(STDOUT, begin(channel) + stdout_end(channel, exit_code)),
+        frame(STDERR, begin(channel) + stderr_end(channel)),
+    )
+    assert channel.run("exit 1", 1024, 5)[0] == expected
+    assert not channel.closed
+
+
+def test_output_over_cap_closes_channel(channel):
+    send(channel, frame(STDOUT, begin(channel) + b"x" * 64))
+    exit_code, out, err = channel.run("yes", 16, 5)
+    assert exit_code == -1
+    assert out == b"x" * 64
+    assert channel.closed
+    with pytest.raises(ShellChannelClosed):
+        channel.run("true", 16, 5)
+
+
+def test_timeout_closes_channel(channel):
+    send(channel, frame(STDOUT, begin(channel) + b"partial"))
+    exit_code, out, err = channel.run("sleep 60", 1024, 0.2)
+    assert exit_code == -1
+    assert out == b"partial"
+    assert err.endswith(timeout_note(0.2).encode())
+    assert channel.closed
+
+
+def test_shell_exit_mid_command(channel):
+    send(channel, frame(STDOUT, begin(channel) + b"partial"))
+    channel.daemon.shutdown(socket.SHUT_WR)
+    assert channel.run("exit", 1024, 5) == (-1, b"partial", b"")
+    assert channel.closed
+
+
+def test_busy_channel_raises(channel):
+    channel._lock.acquire()
+    try:
+        with pytest.raises(ShellChannelBusy):
+            channel.run("true", 1024, 5)
+    finally:
+        channel._lock.release()
+
+
+def test_command_runs_in_its_own_shell(channel):
+    send(
+        channel,
+        frame(STDOUT, begin(channel) + stdout_end(channel, 0)),
+        frame(STDERR, begin(channel) + stderr_end(channel)),
+    )
+    channel.run("echo 'a b'", 1024, 5)
+    script = channel.daemon.recv(4096).decode()
+    assert "/bin/sh -c 'echo '\"'\"'a b'\"'\"'' </dev/null" in script
+
+
+@pytest.mark.parametrize("command, shareable", [
+    ("a && b", True),
+    ("python run.py 2>&1", True),
+    ("ls &>/dev/null", True),
+    ("cat <&3", True),
+    ("sleep 10 &", False),
+    ("a & b", False),
+    ("nohup python server.py", False),
+    ("setsid worker", False),
+    # A quoted "&" is a false positive; it only costs the shared channel
+    ('echo "a&b"', False),
+])
+def test_can_run(command, shareable):
+    assert ShellChannel.can_run(command) is shareable